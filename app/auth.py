@@ -1,39 +1,176 @@
+import time
+import base64
+import hashlib
+import hmac
+import json
+from calendar import timegm
+import threading
+import bcrypt
+from collections import OrderedDict
+import os
+import jwt
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from jose import jwt
 
 # Config
 SECRET_KEY = "CHANGE_THIS_IN_PRODUCTION_TO_A_VERY_SECRET_KEY"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 120
 
-# Force bcrypt to use a backend that handles long passwords or just use pbkdf2_sha256 as fallback
-# But wait, bcrypt has a 72 byte limit.
-# The error "ValueError: password cannot be longer than 72 bytes" happens during init?
-# It seems passlib is trying to detect bugs and failing.
-# Let's switch to pbkdf2_sha256 which is safer/easier if bcrypt is acting up on Windows/this version.
-
+# passlib is kept only to identify/verify legacy hashes; new hashes are
+# bcrypt via the bcrypt C extension directly (see below).
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
-def verify_password(plain_password, hashed_password):
+# PBKDF2 via hashlib.pbkdf2_hmac (OpenSSL's C loop) instead of passlib's
+# backend, which costs a Python-level call per iteration. Only the verify
+# path remains — rounds and salt are parsed out of the stored
+# "$pbkdf2-sha256$rounds$salt$checksum" hash; new hashes are bcrypt.
+def _ab64_decode(data: str) -> bytes:
+    data = data.replace(".", "+")
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+def _pbkdf2_hash(password: str, salt: bytes, rounds: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, rounds, 32)
+
+# bcrypt is the hashing scheme for new passwords. We call the bcrypt C
+# extension directly (no passlib wrapper) and pre-truncate to bcrypt's
+# 72-byte input limit ourselves — it was passlib's long-password detection
+# probe that blew up with "password cannot be longer than 72 bytes" and
+# forced the pbkdf2 fallback in the first place.
+BCRYPT_ROUNDS = 12
+
+# Password hashing runs on a small dedicated pool instead of directly on the
+# request thread. bcrypt's C extension releases the GIL, so worker threads
+# give real parallelism, and the fixed worker count caps how many expensive
+# hashes can run at once — a burst of login attempts queues here instead of
+# pinning every server thread on CPU-bound hashing.
+_HASH_POOL = ThreadPoolExecutor(
+    max_workers=min(4, os.cpu_count() or 1),
+    thread_name_prefix="pwhash",
+)
+
+def _bcrypt_secret(password: str) -> bytes:
+    return password.encode("utf-8")[:72]
+
+def _verify_password(plain_password, hashed_password):
+    if hashed_password and hashed_password.startswith(("$2a$", "$2b$", "$2y$")):
+        try:
+            return bcrypt.checkpw(_bcrypt_secret(plain_password), hashed_password.encode("ascii"))
+        except ValueError:
+            return False
+    if hashed_password and hashed_password.startswith("$pbkdf2-sha256$"):
+        try:
+            _, _, rounds, salt, checksum = hashed_password.split("$")
+            expected = _pbkdf2_hash(plain_password, _ab64_decode(salt), int(rounds))
+            return hmac.compare_digest(expected, _ab64_decode(checksum))
+        except (ValueError, TypeError):
+            pass  # malformed — let passlib try to identify it
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_password(plain_password, hashed_password):
+    return _HASH_POOL.submit(_verify_password, plain_password, hashed_password).result()
+
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _HASH_POOL.submit(
+        lambda: bcrypt.hashpw(_bcrypt_secret(password), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("ascii")
+    ).result()
+
+class _TokenCache:
+    """
+    LRU cache for verified tokens so repeat requests with the same bearer
+    token skip the HMAC + JSON parse in jwt.decode.
+    Entries are evicted when the token's own exp passes (minus a small skew)
+    or under LRU pressure. Failed verifications are cached briefly too, so a
+    token-spray can't force a signature check per request.
+    """
+    def __init__(self, maxsize=4096, skew=5, negative_ttl=30):
+        self.maxsize = maxsize
+        self.skew = skew
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # token -> (payload or None, expiry_ts)
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        # Returns (hit, payload). payload can be None for a cached failure.
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return False, None
+            payload, expiry_ts = entry
+            if time.time() >= expiry_ts - self.skew:
+                del self._entries[token]
+                return False, None
+            self._entries.move_to_end(token)
+            return True, payload
+
+    def put(self, token, payload, expiry_ts):
+        with self._lock:
+            self._entries[token] = (payload, expiry_ts)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+_decode_cache = _TokenCache()
+
+# Freshly issued tokens for identical claims are reused for a short window,
+# so e.g. a client retrying login doesn't pay the signing cost twice.
+_issue_cache = _TokenCache(maxsize=1024)
+ISSUE_CACHE_WINDOW_SECONDS = 30
+
+def _b64url(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+# We only ever sign HS256, so the JOSE header never changes — serialize it
+# once, and keep a primed HMAC whose .copy() reuses the key schedule instead
+# of re-deriving ipad/opad from the secret on every token.
+_JWT_HEADER_B64 = _b64url(json.dumps({"alg": ALGORITHM, "typ": "JWT"}, separators=(",", ":")).encode("ascii"))
+_HMAC_PROTO = hmac.new(SECRET_KEY.encode("utf-8"), digestmod=hashlib.sha256)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    try:
+        issue_key = (tuple(sorted(data.items())), expires_delta)
+        # Building the tuple succeeds even with unhashable claim values
+        # (e.g. a list); probe hashability here so the cache lookup below
+        # can't blow up.
+        hash(issue_key)
+    except TypeError:
+        issue_key = None  # unhashable claim values, just sign
+    if issue_key is not None:
+        hit, cached = _issue_cache.get(issue_key)
+        if hit and cached is not None:
+            return cached
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": timegm(expire.utctimetuple())})
+    payload_b64 = _b64url(json.dumps(to_encode, separators=(",", ":")).encode("utf-8"))
+    signing_input = _JWT_HEADER_B64 + b"." + payload_b64
+    mac = _HMAC_PROTO.copy()  # skips the per-call ipad/opad key schedule
+    mac.update(signing_input)
+    encoded_jwt = (signing_input + b"." + _b64url(mac.digest())).decode("ascii")
+    if issue_key is not None:
+        _issue_cache.put(issue_key, encoded_jwt, time.time() + ISSUE_CACHE_WINDOW_SECONDS)
     return encoded_jwt
 
 def decode_access_token(token: str):
+    # Callers get a fresh dict, never the cached one: endpoints enrich the
+    # payload in place (/me adds formation_name etc.), and handing out the
+    # cached entry would make those mutations stick for every later request
+    # with the same token.
+    hit, payload = _decode_cache.get(token)
+    if hit:
+        return dict(payload) if payload is not None else None
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
+        # Cache the failure briefly to blunt repeated bad-token floods
+        _decode_cache.put(token, None, time.time() + _decode_cache.negative_ttl)
         return None
+    exp = payload.get("exp")
+    expiry_ts = float(exp) if exp is not None else time.time() + 60
+    _decode_cache.put(token, payload, expiry_ts)
+    return dict(payload)
@@ -1,26 +1,145 @@
+import base64
+import json
+import threading
+import time
 from typing import Optional, List, Union, Tuple
-from sqlalchemy.orm import Session
-from sqlalchemy import select, or_, case, func, distinct, text
+from sqlalchemy.orm import Session, selectinload, joinedload, contains_eager
+from sqlalchemy import select, insert, update, delete, or_, func, distinct, tuple_, union_all, lambda_stmt, event, inspect
+from sqlalchemy.exc import IntegrityError
 from datetime import date, datetime
 from . import models
 
-# Rank order mapping (Highest to Lowest)
-RANK_ORDER = [
-    "CGI", "DCG", "ACG", "CIS", "DCI", "ACI", "CSI", "SI", "DSI",
-    "ASI 1", "ASI 2", "II", "AII", "IA 1", "IA 2", "IA 3"
-]
+# Rank order mapping (Highest to Lowest) — canonical copy lives in models.py
+RANK_ORDER = models.RANK_ORDER
+RANK_WHENS = models.RANK_WHENS
+
+# Keyset (seek) pagination cursors. OFFSET N makes the DB produce and throw
+# away N rows; a cursor carrying the last row's sort key lets every page be
+# an index seek instead. Cursors travel as base64'd JSON at the API boundary.
+# Dates inside a cursor sort NULLs to the end via this sentinel.
+HIGH_DATE = date(9999, 12, 31)
+# Offsets at or past this use the two-phase id-prefetch path in list_staff.
+DEEP_PAGE_OFFSET = 500
+# Where count_mode="capped" stops counting: big enough for any pager the UI
+# renders, small enough that huge filter sets don't pay a full scan.
+COUNT_CAP = 10000
+
+def encode_cursor(*values) -> str:
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor: str) -> Optional[list]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return values if isinstance(values, list) else None
+    except Exception:
+        return None
+
+class _TTLCache:
+    """
+    Tiny per-process TTL cache for reference data (states, LGAs, offices)
+    that barely changes but was re-selected on every page render. Values are
+    detached ORM rows with all columns loaded, so reads never touch a session.
+    """
+    def __init__(self, maxsize: int = 64, ttl: int = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = {}  # key -> (value, expiry_ts)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expiry_ts = entry
+        if time.time() >= expiry_ts:
+            del self._entries[key]
+            return None
+        return value
+
+    def put(self, key, value):
+        if len(self._entries) >= self.maxsize:
+            # Drop the stalest entry; simple and good enough at this size
+            oldest = min(self._entries, key=lambda k: self._entries[k][1])
+            del self._entries[oldest]
+        self._entries[key] = (value, time.time() + self.ttl)
+
+    def clear(self):
+        self._entries.clear()
+
+# States/LGAs are fixed between deploys; offices change rarely and the cache
+# is cleared on every office write.
+_states_cache = _TTLCache(maxsize=2, ttl=3600)
+_lgas_cache = _TTLCache(maxsize=64, ttl=3600)
+_offices_cache = _TTLCache(maxsize=64, ttl=300)
+# Dashboard stats don't need per-request freshness; 30s staleness is fine.
+_dashboard_cache = _TTLCache(maxsize=128, ttl=30)
+# Formation subtrees are re-resolved by several endpoints per session but
+# the tree itself only changes through create/update_formation, which clear
+# this. The TTL is just a backstop for multi-process deployments.
+_descendants_cache = _TTLCache(maxsize=512, ttl=60)
+# Global admin rosters (special/main admins) queried on every broadcast;
+# the set changes rarely, and role writes clear this. 60s bounds staleness
+# across processes.
+_admin_ids_cache = _TTLCache(maxsize=4, ttl=60)
+
+def _get_special_admin_user_ids(db: Session) -> List[int]:
+    cached = _admin_ids_cache.get("special_admin")
+    if cached is not None:
+        return cached
+    ids = db.scalars(select(models.User.id).where(models.User.role == "special_admin")).all()
+    _admin_ids_cache.put("special_admin", ids)
+    return ids
+
+def _get_main_admin_staff_ids(db: Session) -> List[int]:
+    cached = _admin_ids_cache.get("main_admin")
+    if cached is not None:
+        return cached
+    ids = db.scalars(select(models.Staff.id).where(models.Staff.role == "main_admin")).all()
+    _admin_ids_cache.put("main_admin", ids)
+    return ids
+
+# ORM-level role writes (e.g. the update_staff_role endpoint mutates
+# obj.role directly) don't go through the crud helpers that clear this
+# cache explicitly, so catch them at flush time. Core UPDATE paths bypass
+# mapper events and keep their explicit clears.
+@event.listens_for(models.Staff, "after_update")
+@event.listens_for(models.User, "after_update")
+def _clear_admin_ids_on_role_change(mapper, connection, target):
+    if inspect(target).attrs.role.history.has_changes():
+        _admin_ids_cache.clear()
 
 def list_states(db: Session) -> List[models.State]:
-    return list(db.scalars(select(models.State).order_by(models.State.name)))
+    cached = _states_cache.get("states")
+    if cached is not None:
+        return cached
+    result = db.scalars(select(models.State).order_by(models.State.name)).all()
+    _states_cache.put("states", result)
+    return result
 
 def list_lgas_by_state(db: Session, state_id: int) -> List[models.LGA]:
-    return list(db.scalars(select(models.LGA).where(models.LGA.state_id == state_id).order_by(models.LGA.name)))
+    cached = _lgas_cache.get(state_id)
+    if cached is not None:
+        return cached
+    result = db.scalars(select(models.LGA).where(models.LGA.state_id == state_id).order_by(models.LGA.name)).all()
+    _lgas_cache.put(state_id, result)
+    return result
 
 def get_staff(db: Session, staff_id: int) -> Optional[models.Staff]:
-    return db.get(models.Staff, staff_id)
+    # Eager-join the three relationships the detail serializer always reads,
+    # so a fresh fetch is one LEFT-JOINed query instead of a row load plus
+    # three lazy SELECTs. db.get still short-circuits on identity-map hits.
+    return db.get(models.Staff, staff_id, options=(
+        joinedload(models.Staff.state),
+        joinedload(models.Staff.lga),
+        joinedload(models.Staff.formation),
+    ))
 
 def get_staff_by_nis(db: Session, nis_no: str) -> Optional[models.Staff]:
-    return db.scalar(select(models.Staff).where(models.Staff.nis_no == nis_no))
+    # lambda_stmt caches the statement construction; every call after the
+    # first is a cache lookup with nis_no as the bound parameter. This runs
+    # on each staff login, so the saved build/compile work adds up.
+    stmt = lambda_stmt(lambda: select(models.Staff).where(models.Staff.nis_no == nis_no))
+    return db.scalar(stmt)
 
 def list_staff(
     db: Session,
@@ -41,21 +160,15 @@ def list_staff(
     formation_id: Optional[Union[int, List[int]]] = None,
     include_count: bool = False,
     gender: Optional[Union[str, List[str]]] = None,
-    retirement_year: Optional[int] = None
+    retirement_year: Optional[int] = None,
+    after: Optional[Tuple] = None,
+    count_mode: str = "exact"
 ) -> Union[List[models.Staff], Tuple[List[models.Staff], int]]:
-    # Build Rank Sorting Logic
-    # We want to sort by Rank (Custom Order), then DOPA (Date of Present Appointment), then NIS No
-    
-    # Create a CASE statement for rank ordering
-    # Assign index 0 to highest rank, 1 to next, etc.
-    # If rank is not in list, put it at the end (e.g. 999)
-    whens = {name: i for i, name in enumerate(RANK_ORDER)}
-    rank_sort = case(
-        whens, 
-        value=models.Staff.rank, 
-        else_=999
-    )
-    
+    # `after` is a keyset cursor (rank_order, dopa, nis_no) from the last row
+    # of the previous page; only honoured for the default seniority sort.
+    # Rank Sorting: by Rank (Custom Order), then DOPA (Date of Present
+    # Appointment), then NIS No. The persisted rank_order column carries the
+    # custom order so the DB sorts on an indexed integer instead of a CASE.
     stmt = select(models.Staff)
     
     if status == "active":
@@ -107,191 +220,358 @@ def list_staff(
             stmt = stmt.where(models.Staff.formation_id == formation_id)
     
     if retirement_year:
-        # PostgreSQL syntax
-        if db.bind.dialect.name == 'postgresql':
-            ret_date_expr = func.least(
-                models.Staff.dob + text("INTERVAL '60 years'"),
-                models.Staff.dofa + text("INTERVAL '35 years'")
-            )
-            stmt = stmt.where(func.extract('year', ret_date_expr) == retirement_year)
-        else:
-            # SQLite fallback
-            ret_date_expr = func.min(
-                func.date(models.Staff.dob, '+60 years'),
-                func.date(models.Staff.dofa, '+35 years')
-            )
-            stmt = stmt.where(func.strftime('%Y', ret_date_expr) == str(retirement_year))
+        # retirement_date is materialized (see models.staff_retirement_date),
+        # so the year filter is a sargable range on one dialect-agnostic
+        # column instead of per-row date arithmetic plus extract().
+        stmt = stmt.where(models.Staff.retirement_date.between(
+            date(retirement_year, 1, 1), date(retirement_year, 12, 31)
+        ))
 
+    # is_complete is maintained by the Staff flush listeners (the critical
+    # fields are models.COMPLETENESS_FIELDS), so both branches are one
+    # indexed equality instead of a 20-term predicate per row.
     if completeness == "completed":
-        # Criteria: Must have all critical fields filled
-        stmt = stmt.where(
-            models.Staff.surname.is_not(None), models.Staff.surname != "",
-            models.Staff.other_names.is_not(None), models.Staff.other_names != "",
-            models.Staff.rank.is_not(None), models.Staff.rank != "",
-            models.Staff.gender.is_not(None), models.Staff.gender != "",
-            models.Staff.dob.is_not(None),
-            models.Staff.phone_no.is_not(None), models.Staff.phone_no != "",
-            models.Staff.state_id.is_not(None),
-            models.Staff.lga_id.is_not(None),
-            models.Staff.office.is_not(None), models.Staff.office != "",
-            models.Staff.dofa.is_not(None),
-            models.Staff.dopa.is_not(None),
-            models.Staff.dopp.is_not(None)
-        )
+        stmt = stmt.where(models.Staff.is_complete == 1)
     elif completeness == "incomplete":
-        # Criteria: Missing ANY of the critical fields
-        stmt = stmt.where(
-            or_(
-                models.Staff.surname.is_(None), models.Staff.surname == "",
-                models.Staff.other_names.is_(None), models.Staff.other_names == "",
-                models.Staff.rank.is_(None), models.Staff.rank == "",
-                models.Staff.gender.is_(None), models.Staff.gender == "",
-                models.Staff.dob.is_(None),
-                models.Staff.phone_no.is_(None), models.Staff.phone_no == "",
-                models.Staff.state_id.is_(None),
-                models.Staff.lga_id.is_(None),
-                models.Staff.office.is_(None), models.Staff.office == "",
-                models.Staff.dofa.is_(None),
-                models.Staff.dopa.is_(None),
-                models.Staff.dopp.is_(None)
-            )
-        )
+        stmt = stmt.where(models.Staff.is_complete == 0)
 
     if q:
-        like = f"%{q}%"
-        stmt = stmt.where(
-            or_(
-                models.Staff.surname.ilike(like),
-                models.Staff.other_names.ilike(like),
-                models.Staff.nis_no.ilike(like),
-                models.Staff.phone_no.ilike(like),
-                models.Staff.office.ilike(like),
-            )
-        )
+        # search_blob holds the lowercased concatenation of the five
+        # searchable fields, so one LIKE replaces five per-row ilike matches
+        stmt = stmt.where(models.Staff.search_blob.like(f"%{q.lower()}%"))
 
     total_count = 0
+    count_stmt = None
+    # Only exact counting can ride the page query as a window function; a
+    # capped count needs its own bounded statement.
+    exact_count = include_count and count_mode == "exact"
     if include_count:
-        # Clone query for count
-        count_stmt = select(func.count()).select_from(stmt.subquery())
-        total_count = db.scalar(count_stmt) or 0
+        if count_mode == "capped":
+            # Count over a LIMITed id subquery so the scan stops at the cap
+            # instead of walking the whole filtered set; the UI shows the
+            # total as "10000+" past that.
+            count_stmt = select(func.count()).select_from(
+                stmt.with_only_columns(models.Staff.id).order_by(None).limit(COUNT_CAP).subquery()
+            )
+        else:
+            # The exact total normally piggy-backs on the page query as
+            # COUNT(*) OVER() below; this standalone form is the fallback
+            # when the page comes back empty (offset past the end) and the
+            # window has no rows.
+            # select_from is required: with no WHERE clause (status=all and no
+            # filters) with_only_columns would otherwise drop the FROM and the
+            # statement degenerates to a bare SELECT count(*) returning 1.
+            count_stmt = (
+                stmt.with_only_columns(func.count())
+                .select_from(models.Staff)
+                .order_by(None)
+            )
 
-    # Apply sorting
+    # Count-only callers (dashboard badges) pass limit=0: skip the page
+    # query and its sort entirely.
+    if limit == 0:
+        if include_count:
+            return [], db.scalar(count_stmt) or 0
+        return []
+
+    # Apply sorting. The order columns are kept in a list so the deep-offset
+    # branch below can reuse them on its second query.
     if status == "exited" and dopp_order in ("asc", "desc"):
-        stmt = stmt.order_by(
+        order_cols = [
             models.Staff.exit_date.asc() if dopp_order == "asc" else models.Staff.exit_date.desc(),
             models.Staff.nis_no
-        )
+        ]
     elif dopp_order in ("asc", "desc"):
-        stmt = stmt.order_by(
+        order_cols = [
             models.Staff.dopp.asc() if dopp_order == "asc" else models.Staff.dopp.desc(),
             models.Staff.nis_no
-        )
+        ]
     elif dopp_order in ("retirement_asc", "retirement_desc"):
-        # Check dialect
-        dialect = db.bind.dialect.name
-        
-        if dialect == "postgresql":
-            # Postgres specific: Use INTERVAL and LEAST
-            # Cast literal to Date for coalesce compatibility
-            high_date = func.cast('9999-12-31', models.Date)
-            
-            dob_plus_60 = models.Staff.dob + text("INTERVAL '60 years'")
-            dofa_plus_35 = models.Staff.dofa + text("INTERVAL '35 years'")
-            
-            ret_date = func.least(
-                func.coalesce(dob_plus_60, high_date),
-                func.coalesce(dofa_plus_35, high_date)
+        # NULL retirement dates (CGI exemption, missing dob/dofa) coalesce to
+        # the sentinel so they sort after everyone with a real date.
+        ret_key = func.coalesce(models.Staff.retirement_date, HIGH_DATE)
+        order_cols = [
+            ret_key.asc() if dopp_order == "retirement_asc" else ret_key.desc(),
+            models.Staff.nis_no
+        ]
+    else:
+        # dopa is coalesced so rows without one sort last on every dialect,
+        # which keeps the order stable across keyset pages.
+        dopa_key = func.coalesce(models.Staff.dopa, HIGH_DATE)
+        if after is not None and len(after) == 3:
+            # Seek past the cursor row instead of OFFSET-scanning to it
+            after_rank, after_dopa, after_nis = after
+            stmt = stmt.where(
+                tuple_(models.Staff.rank_order, dopa_key, models.Staff.nis_no) >
+                tuple_(after_rank, after_dopa if after_dopa is not None else HIGH_DATE, after_nis)
             )
-             # CGI Exempt (infinite retirement)
-            sort_expr = case(
-                (models.Staff.rank == 'CGI', high_date),
-                else_=ret_date
+            offset = 0
+        order_cols = [models.Staff.rank_order, dopa_key.asc(), models.Staff.nis_no]
+
+    stmt = stmt.order_by(*order_cols)
+
+    # Serialization (to_dict_staff) and the exports touch state/lga/formation
+    # on every row, so load them eagerly: 3 extra IN-queries per page instead
+    # of 3 lazy SELECTs per staff row.
+    eager_opts = (
+        selectinload(models.Staff.state),
+        selectinload(models.Staff.lga),
+        selectinload(models.Staff.formation),
+    )
+
+    if offset >= DEEP_PAGE_OFFSET:
+        # Deep offset without a cursor (clients that jump straight to page
+        # N): resolve just the ids first so the offset scan walks the sort
+        # index instead of materializing and discarding full rows, then
+        # fetch exactly `limit` rows by primary key.
+        id_cols = [models.Staff.id]
+        if exact_count:
+            id_cols.append(func.count().over())
+        id_stmt = stmt.with_only_columns(*id_cols).offset(offset).limit(limit)
+        id_rows = db.execute(id_stmt).all()
+        ids = [r[0] for r in id_rows]
+        if exact_count:
+            total_count = id_rows[0][1] if id_rows else (db.scalar(count_stmt) or 0)
+        elif include_count:
+            total_count = db.scalar(count_stmt) or 0
+        if ids:
+            row_stmt = (
+                select(models.Staff)
+                .options(*eager_opts)
+                .where(models.Staff.id.in_(ids))
+                .order_by(*order_cols)
             )
+            items = db.scalars(row_stmt).all()
         else:
-            # SQLite fallback (existing logic)
-            # Calculate retirement date: MIN(DOB+60, DOFA+35)
-            # Handle missing dates by defaulting to high date (9999-12-31) so they don't block MIN
-            ret_date = func.min(
-                func.coalesce(func.date(models.Staff.dob, '+60 years'), '9999-12-31'),
-                func.coalesce(func.date(models.Staff.dofa, '+35 years'), '9999-12-31')
-            )
-            # CGI Exempt (infinite retirement)
-            sort_expr = case(
-                (models.Staff.rank == 'CGI', '9999-12-31'),
-                else_=ret_date
-            )
-            
-        stmt = stmt.order_by(
-            sort_expr.asc() if dopp_order == "retirement_asc" else sort_expr.desc(),
-            models.Staff.nis_no
-        )
+            items = []
     else:
-        stmt = stmt.order_by(
-            rank_sort, 
-            models.Staff.dopa.asc(),
-            models.Staff.nis_no
-        )
-    
-    stmt = stmt.offset(offset).limit(limit)
-    
-    items = list(db.scalars(stmt))
+        stmt = stmt.options(*eager_opts).offset(offset).limit(limit)
+        # Export-sized pages (the PDF/Excel endpoints pass limit=10000)
+        # stream from the cursor in batches instead of buffering the whole
+        # result in the driver; UI-sized pages aren't worth the server-side
+        # cursor.
+        if limit > 1000:
+            stmt = stmt.execution_options(yield_per=500)
+        if exact_count and after is None:
+            # COUNT(*) OVER() rides the page query: the window is computed
+            # before LIMIT, so every row carries the full filtered total and
+            # the second count round-trip disappears.
+            rows = db.execute(stmt.add_columns(func.count().over())).all()
+            items = [r[0] for r in rows]
+            total_count = rows[0][1] if rows else (db.scalar(count_stmt) or 0)
+        else:
+            if include_count:
+                # Cursor pages narrow the WHERE past the cursor row (the
+                # window would undercount), and capped counts need their
+                # bounded statement either way.
+                total_count = db.scalar(count_stmt) or 0
+            items = db.scalars(stmt).all()
     
     if include_count:
         return items, total_count
     return items
 
 def create_staff(db: Session, data: dict) -> models.Staff:
-    exists = get_staff_by_nis(db, data["nis_no"])
-    if exists:
-        raise ValueError("NIS/No already exists")
+    # No pre-check SELECT: nis_no is unique in the schema, so let the
+    # constraint do the duplicate detection. Saves a round trip on every
+    # create and closes the check-then-insert race under concurrency.
     if not data.get("office"):
         data["office"] = "Not Assigned"
     obj = models.Staff(**data)
     db.add(obj)
-    db.commit()
-    db.refresh(obj)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise ValueError("NIS/No already exists")
     return obj
 
+def create_staff_bulk(db: Session, rows: List[dict]) -> Tuple[int, List[str]]:
+    # One multi-row INSERT for imports instead of a round-trip and commit per
+    # record. Duplicate NIS numbers (already in the table or repeated within
+    # the batch) are skipped and reported rather than failing the whole
+    # statement. Core inserts bypass the ORM listeners, so the derived
+    # columns are filled in here, and rows are normalized to one key set
+    # because executemany requires homogeneous parameters.
+    if not rows:
+        return 0, []
+    errors = []
+    existing = set(db.scalars(
+        select(models.Staff.nis_no).where(models.Staff.nis_no.in_([r.get("nis_no") for r in rows]))
+    ))
+    all_keys = set()
+    for r in rows:
+        all_keys.update(r)
+    seen = set()
+    to_insert = []
+    for r in rows:
+        nis = r.get("nis_no")
+        if nis in existing or nis in seen:
+            errors.append(f"{nis}: NIS/No already exists")
+            continue
+        seen.add(nis)
+        data = {k: r.get(k) for k in all_keys}
+        if not data.get("office"):
+            data["office"] = "Not Assigned"
+        data["office_lower"] = data["office"].lower() if data["office"] else None
+        data["rank_order"] = models.RANK_WHENS.get(data.get("rank"), 999)
+        blob_values = [data.get(f) for f in models.SEARCH_BLOB_FIELDS]
+        data["search_blob"] = " ".join(str(v).lower() for v in blob_values if v)
+        data["is_complete"] = models.staff_is_complete(data)
+        data["retirement_date"] = models.staff_retirement_date(
+            data.get("rank"), data.get("dob"), data.get("dofa"))
+        to_insert.append(data)
+    if not to_insert:
+        return 0, errors
+    try:
+        db.execute(insert(models.Staff), to_insert)
+        db.commit()
+    except IntegrityError:
+        # A row that slipped past validation (e.g. a NULL in a NOT NULL
+        # column) fails the whole multi-row statement. Fall back to per-row
+        # inserts so the valid records still land and the offenders get
+        # per-row errors, like the old import path.
+        db.rollback()
+        inserted = 0
+        for data in to_insert:
+            try:
+                db.execute(insert(models.Staff), [data])
+                db.commit()
+            except IntegrityError as e:
+                db.rollback()
+                errors.append(f"{data.get('nis_no')}: {e.orig}")
+            else:
+                inserted += 1
+        return inserted, errors
+    return len(to_insert), errors
+
 def update_staff(db: Session, obj: models.Staff, data: dict) -> models.Staff:
     for k, v in data.items():
         setattr(obj, k, v)
     db.add(obj)
     db.commit()
-    db.refresh(obj)
+    if "role" in data:
+        _admin_ids_cache.clear()
     return obj
 
+def update_staff_fields(db: Session, staff_id: int, data: dict) -> bool:
+    # Core UPDATE for callers that only have an id and don't need the ORM
+    # instance back — one round-trip, no load. The set-event listeners don't
+    # fire for Core statements, so the derived columns are recomputed here.
+    values = dict(data)
+    if "rank" in values:
+        values["rank_order"] = models.RANK_WHENS.get(values["rank"], 999)
+    if "office" in values:
+        values["office_lower"] = values["office"].lower() if values["office"] else values["office"]
+    if any(f in values for f in models.SEARCH_BLOB_FIELDS):
+        overrides = {f: (values[f] or "") for f in models.SEARCH_BLOB_FIELDS if f in values}
+        values["search_blob"] = models.staff_search_blob_expr(**overrides)
+    if any(f in values for f in models.COMPLETENESS_FIELDS):
+        comp_overrides = {f: values[f] for f in models.COMPLETENESS_FIELDS if f in values}
+        values["is_complete"] = models.staff_is_complete_expr(**comp_overrides)
+    if any(f in values for f in ("rank", "dob", "dofa")):
+        # Portable SQL for the +60y/+35y arithmetic isn't worth it; one
+        # 3-column SELECT gives the unchanged inputs and Python computes it.
+        row = db.execute(
+            select(models.Staff.rank, models.Staff.dob, models.Staff.dofa)
+            .where(models.Staff.id == staff_id)
+        ).first()
+        if row:
+            values["retirement_date"] = models.staff_retirement_date(
+                values.get("rank", row.rank),
+                values.get("dob", row.dob),
+                values.get("dofa", row.dofa),
+            )
+    result = db.execute(
+        update(models.Staff)
+        .where(models.Staff.id == staff_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if "role" in data:
+        _admin_ids_cache.clear()
+    return result.rowcount > 0
+
 def delete_staff(db: Session, obj: models.Staff) -> None:
     db.delete(obj)
     db.commit()
+    _admin_ids_cache.clear()
 
-def create_audit_log(db: Session, action: str, target: str, details: Optional[str] = None, formation_id: Optional[int] = None, office_id: Optional[int] = None, user_id: Optional[int] = None, username: Optional[str] = None) -> models.AuditLog:
-    obj = models.AuditLog(action=action, target=target, details=details, formation_id=formation_id, office_id=office_id, user_id=user_id, username=username)
-    db.add(obj)
-    db.commit()
-    db.refresh(obj)
-    return obj
+# Audit entries are buffered in-process and flushed as one multi-row INSERT
+# (at request teardown in main.py, or when the buffer fills), so mutating
+# endpoints stop paying a second commit for the audit trail. The trade is
+# that an entry is lost if the process dies before teardown; acceptable for
+# an activity log.
+_audit_buffer: List[dict] = []
+_audit_lock = threading.Lock()
+AUDIT_FLUSH_THRESHOLD = 100
+
+def create_audit_log(db: Session, action: str, target: str, details: Optional[str] = None, formation_id: Optional[int] = None, office_id: Optional[int] = None, user_id: Optional[int] = None, username: Optional[str] = None) -> None:
+    # `db` is unused now but kept so the twenty-odd call sites don't churn.
+    entry = {
+        "action": action, "target": target, "details": details,
+        "formation_id": formation_id, "office_id": office_id,
+        "user_id": user_id, "username": username,
+        "timestamp": datetime.utcnow(),
+    }
+    with _audit_lock:
+        _audit_buffer.append(entry)
+        should_flush = len(_audit_buffer) >= AUDIT_FLUSH_THRESHOLD
+    if should_flush:
+        flush_audit_logs()
+
+def flush_audit_logs() -> int:
+    with _audit_lock:
+        drained = _audit_buffer[:]
+        del _audit_buffer[:]
+    if not drained:
+        return 0
+    from .database import SessionLocal
+    with SessionLocal() as session:
+        session.execute(insert(models.AuditLog), drained)
+        session.commit()
+    return len(drained)
 
-def list_audit_logs(db: Session, limit: int = 100, offset: int = 0, formation_id: Optional[int] = None, office_id: Optional[int] = None, actions: Optional[List[str]] = None) -> List[models.AuditLog]:
-    stmt = select(models.AuditLog).order_by(models.AuditLog.timestamp.desc()).offset(offset).limit(limit)
+def list_audit_logs(db: Session, limit: int = 100, offset: int = 0, formation_id: Optional[int] = None, office_id: Optional[int] = None, actions: Optional[List[str]] = None, after: Optional[int] = None) -> List[models.AuditLog]:
+    # Land anything still buffered so the log view reads its own writes.
+    flush_audit_logs()
+    # `after` is the id of the last row of the previous page; it replaces
+    # OFFSET so deep pages stay O(limit). Ids are assigned in insert order,
+    # which for audit logs is timestamp order, and unlike the timestamp they
+    # compare cleanly on every dialect.
+    stmt = select(models.AuditLog).order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc())
+    if after is not None:
+        stmt = stmt.where(models.AuditLog.id < after)
+    else:
+        stmt = stmt.offset(offset)
+    stmt = stmt.limit(limit)
     if formation_id:
         stmt = stmt.where(models.AuditLog.formation_id == formation_id)
     if office_id:
         stmt = stmt.where(models.AuditLog.office_id == office_id)
     if actions:
         stmt = stmt.where(models.AuditLog.action.in_(actions))
-    return list(db.scalars(stmt))
+    return db.scalars(stmt).all()
 
 def get_all_descendant_ids(db: Session, root_id: int) -> list[int]:
-    ids = {root_id}
-    queue = [root_id]
-    while queue:
-        curr = queue.pop(0)
-        children = db.scalars(select(models.Formation).where(models.Formation.parent_id == curr)).all()
-        for c in children:
-            if c.id not in ids:
-                ids.add(c.id)
-                queue.append(c.id)
-    return list(ids)
+    cached = _descendants_cache.get(root_id)
+    if cached is not None:
+        return cached
+    # Single recursive CTE instead of one query per tree node — the whole
+    # subtree comes back in one round-trip. Supported by both Postgres and
+    # any SQLite new enough to run this app.
+    tree = (
+        select(models.Formation.id)
+        .where(models.Formation.id == root_id)
+        .cte("formation_tree", recursive=True)
+    )
+    tree = tree.union_all(
+        select(models.Formation.id).where(models.Formation.parent_id == tree.c.id)
+    )
+    ids = db.scalars(select(tree.c.id)).all()
+    _descendants_cache.put(root_id, ids)
+    return ids
 
 def get_dashboard_stats(db: Session, formation_id: Optional[Union[int, list[int]]] = None):
     # Recursive ID resolution for Service Headquarters and Zonal Commands
@@ -308,77 +588,109 @@ def get_dashboard_stats(db: Session, formation_id: Optional[Union[int, list[int]
             else:
                 target_ids = [formation_id]
 
-    staff_q = select(func.count(models.Staff.id)).where(models.Staff.exit_date.is_(None))
-    office_q = select(func.count(distinct(models.Staff.office))).where(
-            models.Staff.exit_date.is_(None),
-            models.Staff.office.is_not(None),
-            models.Staff.office != ""
-        )
-    rank_q = select(models.Staff.rank, func.count(models.Staff.id)).where(models.Staff.exit_date.is_(None)).group_by(models.Staff.rank)
+    cache_key = tuple(sorted(target_ids))
+    cached = _dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
+    # One round-trip: group by (rank, office) and fold the headline numbers
+    # out of the groups in Python. The group count is bounded by
+    # ranks x offices, so the result set stays tiny.
+    stats_q = (
+        select(models.Staff.rank, models.Staff.office, func.count(models.Staff.id))
+        .where(models.Staff.exit_date.is_(None))
+        .group_by(models.Staff.rank, models.Staff.office)
+    )
     if target_ids:
-        staff_q = staff_q.where(models.Staff.formation_id.in_(target_ids))
-        office_q = office_q.where(models.Staff.formation_id.in_(target_ids))
-        rank_q = rank_q.where(models.Staff.formation_id.in_(target_ids))
+        stats_q = stats_q.where(models.Staff.formation_id.in_(target_ids))
 
-    total_staff = db.scalar(staff_q)
-    total_offices = db.scalar(office_q)
-    rank_rows = db.execute(rank_q).all()
-    
+    total_staff = 0
+    offices = set()
     rank_counts = {}
-    for rank, count in rank_rows:
+    for rank, office, count in db.execute(stats_q):
+        total_staff += count
+        if office:
+            offices.add(office)
         key = rank or ""
         rank_counts[key] = rank_counts.get(key, 0) + count
-    return {
+    total_offices = len(offices)
+    stats = {
         "total_staff": total_staff,
         "total_offices": total_offices,
         "rank_counts": rank_counts,
     }
+    _dashboard_cache.put(cache_key, stats)
+    return stats
 
 def list_offices(db: Session, formation_id: Optional[int] = None) -> List[str]:
-    # Deprecated: returns distinct strings from Staff table
-    stmt = select(distinct(models.Staff.office)).where(models.Staff.office.is_not(None)).order_by(models.Staff.office)
-    if formation_id:
-        stmt = stmt.where(models.Staff.formation_id == formation_id)
-    return list(db.scalars(stmt))
+    # Deprecated: kept for its List[str] shape, but now reads the normalized
+    # (and cached) Office table instead of DISTINCT-scanning all of staff.
+    return [o.name for o in list_offices_model(db, formation_id)]
 
 def list_offices_model(db: Session, formation_id: Optional[Union[int, List[int]]] = None) -> List[models.Office]:
-    stmt = select(models.Office).order_by(models.Office.name)
+    cache_key = tuple(sorted(formation_id)) if isinstance(formation_id, list) else formation_id
+    cached = _offices_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    # The cached instances outlive the session that loaded them, and
+    # to_dict_office walks parent / parent.parent / formation — eager-load
+    # those here so a cache hit never touches an unloaded relationship on a
+    # detached instance.
+    stmt = (
+        select(models.Office)
+        .options(
+            selectinload(models.Office.parent).selectinload(models.Office.parent),
+            selectinload(models.Office.formation),
+        )
+        .order_by(models.Office.name)
+    )
     if formation_id is not None:
         if isinstance(formation_id, list):
             stmt = stmt.where(models.Office.formation_id.in_(formation_id))
         else:
             stmt = stmt.where(models.Office.formation_id == formation_id)
-    return list(db.scalars(stmt))
+    result = db.scalars(stmt).all()
+    _offices_cache.put(cache_key, result)
+    return result
+
+def invalidate_offices_cache() -> None:
+    # For callers outside crud that insert Office rows directly (the legacy
+    # staff-office sync in main.py) and need subsequent reads to see them.
+    _offices_cache.clear()
 
 def get_office(db: Session, office_id: int) -> Optional[models.Office]:
     return db.get(models.Office, office_id)
 
 def get_office_by_name(db: Session, name: str) -> Optional[models.Office]:
-    return db.scalar(select(models.Office).where(func.lower(models.Office.name) == name.lower()))
+    lowered = name.lower()
+    stmt = lambda_stmt(lambda: select(models.Office).where(models.Office.name_lower == lowered))
+    return db.scalar(stmt)
 
 def create_office(db: Session, name: str, formation_id: Optional[int] = None, office_type: Optional[str] = None, parent_id: Optional[int] = None) -> models.Office:
-    # Check uniqueness within formation
-    stmt = select(models.Office).where(
-        func.lower(models.Office.name) == name.lower(),
-        models.Office.formation_id == formation_id
-    )
-    existing = db.scalar(stmt)
-    if existing:
-        raise ValueError(f"Office '{name}' already exists in this formation")
-
+    # Uniqueness within a formation is enforced by uq_office_name_formation
+    # (name_lower + coalesced formation_id), so insert directly instead of
+    # pre-checking — one round-trip and no check-then-insert race.
     obj = models.Office(name=name, formation_id=formation_id, office_type=office_type, parent_id=parent_id)
     db.add(obj)
-    db.commit()
-    db.refresh(obj)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise ValueError(f"Office '{name}' already exists in this formation")
+    _offices_cache.clear()
     return obj
 
-def update_office(db: Session, office_id: int, name: str, office_type: Optional[str] = None, parent_id: Optional[int] = None) -> Optional[models.Office]:
+def update_office(db: Session, office_id: int, name: str, office_type: Optional[str] = None, parent_id: Optional[int] = None, restrict_staff_formation_id: Optional[int] = None) -> Optional[models.Office]:
+    # Renames the office and backfills Staff.office references in the same
+    # transaction, so a crash between the two can't leave them pointing at
+    # the old name. restrict_staff_formation_id limits the backfill to one
+    # formation (formation admins renaming within their own scope).
     obj = db.get(models.Office, office_id)
     if obj:
+        old_name = obj.name
         # Check uniqueness within formation (excluding self)
         stmt = select(models.Office).where(
-            func.lower(models.Office.name) == name.lower(),
+            models.Office.name_lower == name.lower(),
             models.Office.formation_id == obj.formation_id,
             models.Office.id != office_id
         )
@@ -397,15 +709,32 @@ def update_office(db: Session, office_id: int, name: str, office_type: Optional[
         if parent_id is not None:
             obj.parent_id = parent_id
         db.add(obj)
+
+        # Backfill staff rows that reference the office by name; one
+        # parameterized UPDATE, no session-sync SELECT.
+        if old_name and name and old_name != name:
+            stmt = (
+                update(models.Staff)
+                .where(models.Staff.office == old_name)
+                .values(office=name, office_lower=name.lower(),
+                        search_blob=models.staff_search_blob_expr(office=name))
+                .execution_options(synchronize_session=False)
+            )
+            if restrict_staff_formation_id is not None:
+                stmt = stmt.where(models.Staff.formation_id == restrict_staff_formation_id)
+            db.execute(stmt)
+
         db.commit()
-        db.refresh(obj)
+        _offices_cache.clear()
     return obj
 
 def delete_office(db: Session, office_id: int) -> bool:
-    obj = db.get(models.Office, office_id)
-    if obj:
-        db.delete(obj)
-        db.commit()
+    # One DELETE instead of load-then-delete; rowcount says whether the
+    # office existed.
+    result = db.execute(delete(models.Office).where(models.Office.id == office_id))
+    db.commit()
+    if result.rowcount > 0:
+        _offices_cache.clear()
         return True
     return False
 
@@ -425,7 +754,6 @@ def create_formation(db: Session, name: str, code: str, formation_type: Optional
     obj = models.Formation(name=name, code=code, formation_type=formation_type, parent_id=parent_id)
     db.add(obj)
     db.commit()
-    db.refresh(obj)
 
     # Auto-create Sub-formation for Zonal Commands
     if formation_type == "Zonal Command":
@@ -439,6 +767,7 @@ def create_formation(db: Session, name: str, code: str, formation_type: Optional
             db.add(hq)
             db.commit()
 
+    _descendants_cache.clear()
     return obj
 
 def update_formation(db: Session, formation_id: int, name: str, formation_type: Optional[str] = None, parent_id: Optional[int] = None) -> Optional[models.Formation]:
@@ -451,20 +780,27 @@ def update_formation(db: Session, formation_id: int, name: str, formation_type:
             obj.parent_id = parent_id
         db.add(obj)
         db.commit()
-        db.refresh(obj)
+        _descendants_cache.clear()
     return obj
 
 def list_formations(db: Session) -> List[models.Formation]:
-    return list(db.scalars(select(models.Formation).order_by(models.Formation.name)))
+    return db.scalars(select(models.Formation).order_by(models.Formation.name)).all()
 
 def get_formation(db: Session, formation_id: int) -> Optional[models.Formation]:
     return db.get(models.Formation, formation_id)
 
 def get_pending_edit_requests(db: Session, formation_id: Optional[int] = None) -> List[models.StaffEditRequest]:
-    stmt = select(models.StaffEditRequest).join(models.Staff).where(models.StaffEditRequest.status == "review_pending")
+    # The review UI reads request.staff for every row; piggy-back the load on
+    # the join that is already there instead of lazy-loading per request.
+    stmt = (
+        select(models.StaffEditRequest)
+        .join(models.Staff)
+        .options(contains_eager(models.StaffEditRequest.staff))
+        .where(models.StaffEditRequest.status == "review_pending")
+    )
     if formation_id:
         stmt = stmt.where(models.Staff.formation_id == formation_id)
-    return list(db.scalars(stmt.order_by(models.StaffEditRequest.created_at.asc())))
+    return db.scalars(stmt.order_by(models.StaffEditRequest.created_at.asc())).all()
 
 def get_edit_request(db: Session, request_id: int) -> Optional[models.StaffEditRequest]:
     return db.get(models.StaffEditRequest, request_id)
@@ -477,11 +813,10 @@ def resolve_edit_request(db: Session, request_id: int, status: str, reviewer: st
         req.reviewed_by = reviewer
         db.add(req)
         db.commit()
-        db.refresh(req)
     return req
 
 def get_users_by_formation(db: Session, formation_id: int) -> List[models.User]:
-    return list(db.scalars(select(models.User).where(models.User.formation_id == formation_id)))
+    return db.scalars(select(models.User).where(models.User.formation_id == formation_id)).all()
 
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
     return db.get(models.User, user_id)
@@ -491,20 +826,24 @@ def delete_user(db: Session, user_id: int) -> bool:
     if user:
         db.delete(user)
         db.commit()
+        _admin_ids_cache.clear()
         return True
     return False
 
-def update_user_password(db: Session, user_id: int, password_hash: str) -> Optional[models.User]:
-    user = db.get(models.User, user_id)
-    if user:
-        user.password_hash = password_hash
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    return user
+def update_user_password(db: Session, user_id: int, password_hash: str) -> bool:
+    # Single UPDATE instead of load-then-mutate; callers only check whether
+    # the user existed.
+    result = db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(password_hash=password_hash)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount > 0
 
 def get_custom_field_definitions(db: Session) -> List[models.CustomFieldDefinition]:
-    return list(db.scalars(select(models.CustomFieldDefinition).order_by(models.CustomFieldDefinition.id)))
+    return db.scalars(select(models.CustomFieldDefinition).order_by(models.CustomFieldDefinition.id)).all()
 
 def create_custom_field_definition(db: Session, name: str, label: str, field_type: str = "text") -> models.CustomFieldDefinition:
     # Check if exists
@@ -515,7 +854,6 @@ def create_custom_field_definition(db: Session, name: str, label: str, field_typ
     obj = models.CustomFieldDefinition(name=name, label=label, field_type=field_type)
     db.add(obj)
     db.commit()
-    db.refresh(obj)
     return obj
 
 def delete_custom_field_definition(db: Session, field_id: int) -> bool:
@@ -537,15 +875,14 @@ def create_notification(db: Session, message: str, user_id: Optional[int] = None
     )
     db.add(notif)
     db.commit()
-    db.refresh(notif)
     return notif
 
-def get_user_notifications(db: Session, user_id: int, role: str, formation_id: Optional[int] = None, office_name: Optional[str] = None) -> List[models.Notification]:
+def get_user_notifications(db: Session, user_id: int, role: str, formation_id: Optional[int] = None, office_name: Optional[str] = None, limit: int = 200) -> List[models.Notification]:
     # Build query based on role
     # 1. Direct targeting via user_id (for User table) or staff_id (for Staff table)
-    
+
     conditions = []
-    
+
     if role in ("special_admin", "formation_admin"):
         conditions.append(models.Notification.user_id == user_id)
         if role == "formation_admin" and formation_id:
@@ -557,11 +894,18 @@ def get_user_notifications(db: Session, user_id: int, role: str, formation_id: O
         if role == "office_admin" and office_name:
             # Also include office-wide notifications
             conditions.append(models.Notification.office_name == office_name)
-            
-    # Always include unread, limit read?
-    # For now just get all, sorted by date
-    stmt = select(models.Notification).where(or_(*conditions)).order_by(models.Notification.timestamp.desc())
-    return list(db.scalars(stmt))
+
+    # OR across different columns tends to defeat index use; resolve each
+    # condition as its own index-seekable id SELECT and UNION ALL them (the
+    # outer IN de-duplicates rows matching both branches). The LIMIT keeps
+    # this bounded as the notifications table grows.
+    if len(conditions) == 1:
+        stmt = select(models.Notification).where(conditions[0])
+    else:
+        id_union = union_all(*(select(models.Notification.id).where(c) for c in conditions)).subquery()
+        stmt = select(models.Notification).where(models.Notification.id.in_(select(id_union.c.id)))
+    stmt = stmt.order_by(models.Notification.timestamp.desc(), models.Notification.id.desc()).limit(limit)
+    return db.scalars(stmt).all()
 
 def mark_notification_read(db: Session, notif_id: int) -> bool:
     notif = db.get(models.Notification, notif_id)
@@ -571,31 +915,33 @@ def mark_notification_read(db: Session, notif_id: int) -> bool:
         return True
     return False
 
-def broadcast_notification(db: Session, message: str, formation_id: int = None, office_id: int = None, role: str = None):
+def broadcast_notification(db: Session, message: str, formation_id: int = None, office_id: int = None, role: str = None, commit: bool = True):
     """
     Send notification to specific groups of admins.
     - role="special_admin": All special admins
     - role="main_admin": All main admins
     - formation_id: Formation Admin of that formation
     - office_id: Office Admin of that office
+    Callers that broadcast several times inside one business operation pass
+    commit=False and issue a single commit themselves, so the whole
+    operation costs one fsync instead of one per broadcast.
     """
-    # Notify Special Admins (User table)
+    # Collect all recipient ids first, then write every notification in a
+    # single bulk INSERT + one commit instead of add/commit/refresh per row.
+    rows = []
+
+    # Notify Special Admins (User table); roster comes from the TTL cache
     if role == "special_admin":
-        users = db.scalars(select(models.User).where(models.User.role == "special_admin")).all()
-        for u in users:
-            create_notification(db, message, user_id=u.id)
-            
-    # Notify Main Admins (Staff table)
+        rows.extend({"message": message, "user_id": uid} for uid in _get_special_admin_user_ids(db))
+
+    # Notify Main Admins (Staff table); same cached roster
     if role == "main_admin":
-        staffs = db.scalars(select(models.Staff).where(models.Staff.role == "main_admin")).all()
-        for s in staffs:
-            create_notification(db, message, staff_id=s.id)
+        rows.extend({"message": message, "staff_id": sid} for sid in _get_main_admin_staff_ids(db))
 
     # Notify Formation Admins (User table)
     if formation_id:
-        users = db.scalars(select(models.User).where(models.User.formation_id == formation_id, models.User.role == "formation_admin")).all()
-        for u in users:
-            create_notification(db, message, user_id=u.id)
+        user_ids = db.scalars(select(models.User.id).where(models.User.formation_id == formation_id, models.User.role == "formation_admin")).all()
+        rows.extend({"message": message, "user_id": uid} for uid in user_ids)
 
     # Notify Office Admins (Staff table)
     if office_id:
@@ -603,13 +949,17 @@ def broadcast_notification(db: Session, message: str, formation_id: int = None,
         if office_obj:
             # Find staff who are office_admin in this office
             # Note: staff.office is a string name
-            staffs = db.scalars(select(models.Staff).where(
-                func.lower(models.Staff.office) == office_obj.name.lower(), 
+            staff_ids = db.scalars(select(models.Staff.id).where(
+                models.Staff.office_lower == office_obj.name.lower(),
                 models.Staff.formation_id == office_obj.formation_id,
                 models.Staff.role == "office_admin"
             )).all()
-            for s in staffs:
-                create_notification(db, message, staff_id=s.id)
+            rows.extend({"message": message, "staff_id": sid} for sid in staff_ids)
+
+    if rows:
+        db.execute(insert(models.Notification), rows)
+        if commit:
+            db.commit()
 
 def process_due_retirements(db: Session) -> int:
     """
@@ -618,51 +968,80 @@ def process_due_retirements(db: Session) -> int:
     Returns count of processed retirements.
     """
     today = date.today()
-    
+
     # Find active staff (exit_mode is NULL) where exit_date <= today
     stmt = select(models.Staff).where(
         models.Staff.exit_mode.is_(None),
         models.Staff.exit_date.is_not(None),
         models.Staff.exit_date <= today
     )
-    staff_due = db.scalars(stmt).all()
-    
-    count = 0
+    # CGI is exempt from retirement. Stream the scan in chunks so a large
+    # backlog of due retirements doesn't buffer the whole result set at once.
+    staff_due = [s for s in db.scalars(stmt.execution_options(yield_per=500)) if s.rank != "CGI"]
+    if not staff_due:
+        return 0
+
+    # Resolve every recipient group once up front, instead of re-running the
+    # broadcast_notification queries four times per retired staff.
+    special_admin_ids = _get_special_admin_user_ids(db)
+    main_admin_ids = _get_main_admin_staff_ids(db)
+
+    formation_ids = {s.formation_id for s in staff_due if s.formation_id is not None}
+    formation_admins = {}  # formation_id -> [user_id, ...]
+    if formation_ids:
+        rows = db.execute(select(models.User.id, models.User.formation_id).where(
+            models.User.role == "formation_admin",
+            models.User.formation_id.in_(formation_ids)
+        )).all()
+        for uid, fid in rows:
+            formation_admins.setdefault(fid, []).append(uid)
+
+    # Office admins keyed by (lowercased office name, formation_id); only
+    # offices that actually exist in the Office table get notified, matching
+    # the old per-staff resolution.
+    known_offices = set()
+    office_admins = {}  # (office_lower, formation_id) -> [staff_id, ...]
+    if formation_ids:
+        rows = db.execute(select(models.Office.name_lower, models.Office.formation_id).where(
+            models.Office.formation_id.in_(formation_ids)
+        )).all()
+        known_offices = set(rows)
+        rows = db.execute(select(models.Staff.id, models.Staff.office_lower, models.Staff.formation_id).where(
+            models.Staff.role == "office_admin",
+            models.Staff.formation_id.in_(formation_ids)
+        )).all()
+        for sid, office_lower, fid in rows:
+            office_admins.setdefault((office_lower, fid), []).append(sid)
+
+    # Retire the whole batch in one UPDATE instead of N per-row flushes
+    db.execute(
+        update(models.Staff)
+        .where(models.Staff.id.in_([s.id for s in staff_due]))
+        .values(exit_mode="Retired", allow_login=0)
+        .execution_options(synchronize_session=False)
+    )
+
+    notif_rows = []
     for staff in staff_due:
-        # Skip if CGI (exempt)
-        if staff.rank == "CGI":
-            continue
-            
-        # Process Retirement
-        staff.exit_mode = "Retired"
-        staff.allow_login = 0 # Revoke access
-        
         # Notify Admins
         msg = f"Staff Retired: {staff.nis_no} ({staff.rank}) - {staff.surname} {staff.other_names}"
-        
-        # 1. Special Admin
-        broadcast_notification(db, msg, role="special_admin")
-        
-        # 2. Formation Admin
-        broadcast_notification(db, msg, formation_id=staff.formation_id)
-        
-        # 3. Main Admin
-        broadcast_notification(db, msg, role="main_admin")
-        
-        # 4. Office Admin
+
+        # 1. Special Admins + 2. Formation Admins (User table)
+        user_ids = list(special_admin_ids)
+        user_ids.extend(formation_admins.get(staff.formation_id, []))
+        notif_rows.extend({"message": msg, "user_id": uid} for uid in user_ids)
+
+        # 3. Main Admins + 4. Office Admins (Staff table)
+        staff_ids = list(main_admin_ids)
         if staff.office:
-            # Resolve office ID
-            off_obj = db.scalar(select(models.Office).where(
-                func.lower(models.Office.name) == staff.office.lower(),
-                models.Office.formation_id == staff.formation_id
-            ))
-            if off_obj:
-                broadcast_notification(db, msg, office_id=off_obj.id)
-        
-        count += 1
-        
-    if count > 0:
-        db.commit()
-        
-    return count
+            office_key = (staff.office.lower(), staff.formation_id)
+            if office_key in known_offices:
+                staff_ids.extend(office_admins.get(office_key, []))
+        notif_rows.extend({"message": msg, "staff_id": sid} for sid in staff_ids)
+
+    if notif_rows:
+        db.execute(insert(models.Notification), notif_rows)
+    db.commit()
+
+    return len(staff_due)
 
@@ -1,7 +1,8 @@
 import os
 import platform
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import StaticPool
 
 DB_URL = os.getenv("DATABASE_URL")
 
@@ -36,16 +37,83 @@ if "postgresql://" in DB_URL and "sslmode" not in DB_URL:
 # Fail-safe engine creation
 try:
     connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-    engine = create_engine(DB_URL, future=True, echo=False, connect_args=connect_args)
-    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    # Larger compiled-statement cache: list_staff alone produces many filter
+    # permutations, and the default 500 slots churn under real traffic.
+    engine_kwargs = {"query_cache_size": 1200}
+    if DB_URL.startswith("sqlite") and ":memory:" in DB_URL:
+        # In-memory SQLite exists per connection; share one (see fallback below)
+        engine_kwargs["poolclass"] = StaticPool
+    if not DB_URL.startswith("sqlite"):
+        # Explicit pool sizing for Postgres (Neon over SSL): the default
+        # 5-connection pool serializes concurrent requests, and without
+        # recycle/pre-ping the provider drops idle SSL connections and the
+        # next request eats a stale-connection error. Env overrides let a
+        # deployment resize without a code change (e.g. smaller pools when
+        # many workers share one Postgres connection budget).
+        engine_kwargs.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "1") != "0",
+        )
+    engine = create_engine(DB_URL, future=True, echo=False, connect_args=connect_args,
+                           **engine_kwargs)
+    if DB_URL.startswith("sqlite") and ":memory:" not in DB_URL:
+        # File-backed SQLite ships with journal_mode=DELETE and
+        # synchronous=FULL, so every commit pays a full fsync and readers
+        # block behind writers. WAL + NORMAL keeps durability adequate for
+        # this deployment while letting reads proceed during writes; the
+        # cache/mmap/temp settings cut repeat page reads on the list queries.
+        @event.listens_for(engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA cache_size=-65536")
+            cursor.execute("PRAGMA mmap_size=268435456")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+    if not DB_URL.startswith("sqlite"):
+        # Session-wide server settings applied once per new connection (one
+        # round trip) instead of per query. The timeouts keep a runaway
+        # query or an abandoned transaction from pinning a pooled Neon
+        # connection; jit off skips planner JIT warmup that never pays for
+        # itself on this app's short OLTP statements.
+        @event.listens_for(engine, "connect")
+        def _pg_session_settings(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            cursor.execute(
+                "SET statement_timeout = '30s'; "
+                "SET idle_in_transaction_session_timeout = '60s'; "
+                "SET jit = off"
+            )
+            cursor.close()
+    # expire_on_commit=False: endpoints serialize ORM objects right after
+    # committing, and the default expiry forced a re-SELECT per object (plus
+    # relationship reloads) just to rebuild state we already hold. No model
+    # the mutating endpoints serialize relies on server-side defaults being
+    # refreshed post-commit.
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True,
+                                expire_on_commit=False)
 except Exception as e:
     print(f"CRITICAL DB ERROR: {e}")
-    # Fallback to in-memory SQLite to allow app to start and show error on debug page
+    # Fallback to in-memory SQLite to allow app to start and show error on debug page.
+    # StaticPool pins one shared connection: with the default pool every
+    # checkout opens a *fresh* in-memory database, so tables created at
+    # startup vanish for the next request ("no such table").
     fallback_url = "sqlite:///:memory:"
-    engine = create_engine(fallback_url, future=True, connect_args={"check_same_thread": False})
-    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    engine = create_engine(fallback_url, future=True, connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True,
+                                expire_on_commit=False)
 
-Base = declarative_base()
+# SQLAlchemy 2.x declarative base (declarative_base() is the legacy
+# function API). Existing Column-style models map unchanged, and new
+# models can adopt mapped_column/Mapped[] incrementally.
+class Base(DeclarativeBase):
+    pass
 
 def get_db():
     db = SessionLocal()
@@ -8,86 +8,122 @@ from app.database import Base, get_db, engine
 from app import crud
 from app import models
 import datetime
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker
 
 def test_filters():
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    db = SessionLocal()
-    
+    # Everything runs inside one outer transaction that is rolled back at
+    # the end. The session joins it in create_savepoint mode, so the
+    # commits inside the crud helpers only release savepoints — nothing is
+    # fsynced, no manual cleanup DELETEs are needed, and a failure can't
+    # leave orphan test rows behind.
+    #
+    # pysqlite's lazy transaction handling silently breaks SAVEPOINTs (the
+    # outer rollback becomes a no-op), so on SQLite we take over BEGIN
+    # emission for the duration — the recipe from the SQLAlchemy docs.
+    listeners = []
+    if engine.dialect.name == "sqlite":
+        def _do_connect(dbapi_conn, connection_record):
+            dbapi_conn.isolation_level = None
+
+        def _do_begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+        event.listen(engine, "connect", _do_connect)
+        event.listen(engine, "begin", _do_begin)
+        listeners = [("connect", _do_connect), ("begin", _do_begin)]
+        engine.dispose()  # drop pooled connections created without the hook
+
     try:
-        # 1. Create Test Formation
-        fmt = crud.create_formation(db, "Test Formation Filter", "TFF", formation_type="State Command")
-        print(f"Created Formation: {fmt.id}")
-        
-        # 2. Create Test Office
-        off = crud.create_office(db, "Test Office Filter", fmt.id, "Section")
-        print(f"Created Office: {off.id} - {off.name}")
-        
-        # 3. Create Test Staff
-        staff_data = {
-            "nis_no": "FILTER123",
-            "surname": "Filter",
-            "other_names": "Test",
-            "rank": "ASI 1",
-            "formation_id": fmt.id,
-            "office": "Test Office Filter",
-            "dofa": datetime.date(2020, 1, 1),
-            "dob": datetime.date(1990, 1, 1),
-            "state_id": 1,
-            "lga_id": 1,
-            "gender": "Male",
-            "phone_no": "08000000000"
-        }
-        staff = crud.create_staff(db, staff_data)
-        print(f"Created Staff: {staff.id} - Rank: {staff.rank} - Office: {staff.office}")
-        
-        # 4. Test Rank Filter (Match)
-        print("\n--- Testing Rank Filter (Match) ---")
-        items, count = crud.list_staff(db, rank=["ASI 1"], include_count=True)
-        found = any(s.id == staff.id for s in items)
-        print(f"Filter rank=['ASI 1']: Found={found}, Total={count}")
-        
-        # 5. Test Rank Filter (No Match)
-        print("\n--- Testing Rank Filter (No Match) ---")
-        items, count = crud.list_staff(db, rank=["CGI"], include_count=True)
-        found = any(s.id == staff.id for s in items)
-        print(f"Filter rank=['CGI']: Found={found}, Total={count}")
-
-        # 6. Test Office Filter (Match)
-        print("\n--- Testing Office Filter (Match) ---")
-        items, count = crud.list_staff(db, office=["Test Office Filter"], include_count=True)
-        found = any(s.id == staff.id for s in items)
-        print(f"Filter office=['Test Office Filter']: Found={found}, Total={count}")
-
-        # 7. Test Office Filter (No Match)
-        print("\n--- Testing Office Filter (No Match) ---")
-        items, count = crud.list_staff(db, office=["Non Existent"], include_count=True)
-        found = any(s.id == staff.id for s in items)
-        print(f"Filter office=['Non Existent']: Found={found}, Total={count}")
-
-        # 8. Test Combined Filter
-        print("\n--- Testing Combined Filter ---")
-        items, count = crud.list_staff(db, rank=["ASI 1"], office=["Test Office Filter"], include_count=True)
-        found = any(s.id == staff.id for s in items)
-        print(f"Filter rank=['ASI 1'], office=['Test Office Filter']: Found={found}, Total={count}")
-
-    except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
+        _run_filter_checks()
     finally:
-        # Cleanup
+        for name, fn in listeners:
+            event.remove(engine, name, fn)
+
+def _run_filter_checks():
+    with engine.connect() as conn:
+        tx = conn.begin()
+        SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=conn,
+            join_transaction_mode="create_savepoint",
+        )
+        db = SessionLocal()
+
         try:
-            if 'staff' in locals(): db.delete(staff)
-            if 'off' in locals(): db.delete(off)
-            if 'fmt' in locals(): 
-                # Need to delete sub-formation if Zonal Command created it (but we used State Command)
-                db.delete(fmt)
-            db.commit()
-            print("Cleanup successful")
+            # 1. Create Test Formation
+            fmt = crud.create_formation(db, "Test Formation Filter", "TFF", formation_type="State Command")
+            print(f"Created Formation: {fmt.id}")
+
+            # 2. Create Test Office
+            off = crud.create_office(db, "Test Office Filter", fmt.id, "Section")
+            print(f"Created Office: {off.id} - {off.name}")
+
+            # 3. Create Test State/LGA (FKs are enforced on SQLite now, so
+            # the staff row can't point at magic ids)
+            state = models.State(name="Test State Filter")
+            db.add(state)
+            db.flush()
+            lga = models.LGA(name="Test LGA Filter", state_id=state.id)
+            db.add(lga)
+            db.flush()
+
+            # 4. Create Test Staff
+            staff_data = {
+                "nis_no": "FILTER123",
+                "surname": "Filter",
+                "other_names": "Test",
+                "rank": "ASI 1",
+                "formation_id": fmt.id,
+                "office": "Test Office Filter",
+                "dofa": datetime.date(2020, 1, 1),
+                "dob": datetime.date(1990, 1, 1),
+                "state_id": state.id,
+                "lga_id": lga.id,
+                "gender": "Male",
+                "phone_no": "08000000000"
+            }
+            staff = crud.create_staff(db, staff_data)
+            print(f"Created Staff: {staff.id} - Rank: {staff.rank} - Office: {staff.office}")
+
+            # 5. Test Rank Filter (Match)
+            print("\n--- Testing Rank Filter (Match) ---")
+            items, count = crud.list_staff(db, rank=["ASI 1"], include_count=True)
+            found = staff.id in {s.id for s in items}
+            print(f"Filter rank=['ASI 1']: Found={found}, Total={count}")
+
+            # 6. Test Rank Filter (No Match)
+            print("\n--- Testing Rank Filter (No Match) ---")
+            items, count = crud.list_staff(db, rank=["CGI"], include_count=True)
+            found = staff.id in {s.id for s in items}
+            print(f"Filter rank=['CGI']: Found={found}, Total={count}")
+
+            # 7. Test Office Filter (Match)
+            print("\n--- Testing Office Filter (Match) ---")
+            items, count = crud.list_staff(db, office=["Test Office Filter"], include_count=True)
+            found = staff.id in {s.id for s in items}
+            print(f"Filter office=['Test Office Filter']: Found={found}, Total={count}")
+
+            # 8. Test Office Filter (No Match)
+            print("\n--- Testing Office Filter (No Match) ---")
+            items, count = crud.list_staff(db, office=["Non Existent"], include_count=True)
+            found = staff.id in {s.id for s in items}
+            print(f"Filter office=['Non Existent']: Found={found}, Total={count}")
+
+            # 9. Test Combined Filter
+            print("\n--- Testing Combined Filter ---")
+            items, count = crud.list_staff(db, rank=["ASI 1"], office=["Test Office Filter"], include_count=True)
+            found = staff.id in {s.id for s in items}
+            print(f"Filter rank=['ASI 1'], office=['Test Office Filter']: Found={found}, Total={count}")
+
         except Exception as e:
-            print(f"Cleanup failed: {e}")
-        db.close()
+            print(f"Error: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            db.close()
+            # Discard every test row in one shot
+            tx.rollback()
+            print("Rolled back test transaction")
 
 if __name__ == "__main__":
     test_filters()
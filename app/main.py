@@ -77,6 +77,16 @@ except Exception as e:
     class Alignment: pass
     class PatternFill: pass
 
+@app.teardown_appcontext
+def _flush_audit_buffer(exception=None):
+    # Audit entries queue in-process during the request (see crud) and land
+    # here as one batched INSERT after the handler finishes.
+    if crud is not None:
+        try:
+            crud.flush_audit_logs()
+        except Exception:
+            pass
+
 @app.route("/ping")
 def ping():
     if STARTUP_ERROR:
@@ -751,7 +761,7 @@ def dashboard_stats():
                 .values(
                     exit_date=models.Staff.retirement_date,
                     exit_mode="Statutory Retirement",
-                    remarks="System Auto-Retirement"
+                    remark="System Auto-Retirement"
                 )
             )
             db.commit()
@@ -980,6 +990,7 @@ def import_excel():
                             
         success_count = 0
         errors = []
+        pending_rows = []
 
         with next(get_db()) as db_session:
             states_cache = {s.name.lower(): s.id for s in db_session.query(models.State).all()}
@@ -1022,6 +1033,7 @@ def import_excel():
                     }
                     
                     if not data["surname"] or not data["rank"]: raise ValueError("Missing Surname or Rank")
+                    if not data["other_names"]: raise ValueError("Missing Other Names")
                     if not data["gender"]: raise ValueError("Missing Gender")
                         
                     s_name = get_text_val("State of Origin") or get_text_val("State")
@@ -1039,12 +1051,16 @@ def import_excel():
                     if formation_id is not None:
                         data["formation_id"] = formation_id
 
-                    crud.create_staff(db_session, data)
-                    success_count += 1
+                    # Rows are validated here but inserted in one statement
+                    # below, instead of an INSERT + COMMIT per record.
+                    pending_rows.append(data)
                 except Exception as e:
                     db_session.rollback()
                     errors.append(f"Row {row_idx}: {str(e)}")
-            
+
+            success_count, dup_errors = crud.create_staff_bulk(db_session, pending_rows)
+            errors.extend(dup_errors)
+
             if success_count > 0: crud.create_audit_log(db_session, "IMPORT", filename, f"Imported {success_count} records", formation_id=formation_id, user_id=user["id"], username=user["sub"])
             db_session.commit()
         return jsonify({"message": f"Imported {success_count} records", "errors": errors[:10]})
@@ -1145,6 +1161,10 @@ def list_offices_route():
                 added = True
              if added:
                 db.commit()
+                # This insert path bypasses crud.create_office, so the offices
+                # cache must be dropped by hand or the re-fetch below (and every
+                # /offices read for the next 300s) serves the pre-sync list.
+                crud.invalidate_offices_cache()
                 # Re-fetch with potentially new offices (though we only added to own formation)
                 items = crud.list_offices_model(db, formation_id=search_formation_ids)
                 
@@ -1369,29 +1389,14 @@ def update_office_route(office_id: int):
             if parent_office.office_type not in ["Section", "Division", "Directorate"]:
                 return jsonify({"detail": f"A 'Unit' must be under a Section, Division, or Directorate. Parent is '{parent_office.office_type}'."}), 400
 
-        old_name = current_office.name
-        
         try:
-            obj = crud.update_office(db, office_id, name, office_type=office_type, parent_id=parent_id)
+            # Staff backfill happens inside update_office, in the same
+            # transaction as the rename; scope it for formation-bound users.
+            obj = crud.update_office(
+                db, office_id, name, office_type=office_type, parent_id=parent_id,
+                restrict_staff_formation_id=user.get("formation_id")
+            )
             if not obj: return jsonify({"detail": "Not found"}), 404
-            
-            # If name changed, update all staff records with old office name
-            if old_name and name and old_name != name:
-                from sqlalchemy import update
-                stmt = (
-                    update(models.Staff)
-                    .where(models.Staff.office == old_name)
-                    .values(office=name)
-                )
-                if user["role"] == "formation_admin":
-                    # Restrict update to staff in same formation (though office name should be unique enough usually)
-                    stmt = stmt.where(models.Staff.formation_id == user["formation_id"])
-                elif user.get("formation_id"):
-                     stmt = stmt.where(models.Staff.formation_id == user["formation_id"])
-                     
-                db.execute(stmt)
-                db.commit()
-            
             return jsonify(schemas.to_dict_office(obj))
         except ValueError as e:
             return jsonify({"detail": str(e)}), 400
@@ -1499,7 +1504,23 @@ def list_staff_endpoint():
         dopa_to = parse_date_value(dopa_to_raw) if dopa_to_raw else None
         limit = request.args.get("limit", 50, type=int)
         offset = request.args.get("offset", 0, type=int)
-        
+
+        # "capped" stops counting at crud.COUNT_CAP; the list view uses it
+        # since "are there more pages" doesn't need an exact total. Report
+        # screens keep the default exact count.
+        count_mode = request.args.get("count_mode", "exact")
+        if count_mode not in ("exact", "capped"):
+            count_mode = "exact"
+
+        # Keyset cursor (preferred over offset for deep pages)
+        after = None
+        after_raw = request.args.get("after")
+        if after_raw:
+            decoded = crud.decode_cursor(after_raw)
+            if decoded and len(decoded) == 3:
+                rank_order_val, dopa_val, nis_val = decoded
+                after = (rank_order_val, parse_date_value(dopa_val) if dopa_val else None, nis_val)
+
         formation_id = user.get("formation_id")
         
         # Allow special_admin and main_admin to filter by formation
@@ -1562,13 +1583,21 @@ def list_staff_endpoint():
                 formation_id=formation_id,
                 include_count=True,
                 gender=gender,
-                retirement_year=retirement_year
+                retirement_year=retirement_year,
+                after=after,
+                count_mode=count_mode
             )
+            # Cursor for the next page (default seniority sort only)
+            next_cursor = None
+            if not dopp_order and items and len(items) == limit:
+                last = items[-1]
+                next_cursor = crud.encode_cursor(last.rank_order, last.dopa, last.nis_no)
             return jsonify({
                 "items": [schemas.to_dict_staff(item) for item in items],
                 "total": total_count,
                 "limit": limit,
-                "offset": offset
+                "offset": offset,
+                "next_cursor": next_cursor
             })
     except OperationalError as e:
          if "custom_data" in str(e) and "column" in str(e):
@@ -1926,9 +1955,9 @@ def reset_login_count(staff_id: int):
                 if not admin_staff or admin_staff.office != obj.office:
                     return jsonify({"detail": "Permission denied: Different Office"}), 403
             
-            obj.login_count = 0
-            db.add(obj)
-            db.commit()
+            # Permission checks above needed the loaded row; the write itself
+            # is a single-column Core UPDATE.
+            crud.update_staff_fields(db, staff_id, {"login_count": 0})
             crud.create_audit_log(db, "RESET_LOGIN", f"Staff: {obj.nis_no}", "Reset login count", formation_id=obj.formation_id, office_id=None, user_id=user["id"], username=user["sub"])
             return jsonify({"detail": "Login count reset successfully"})
     except Exception as e:
@@ -1952,9 +1981,8 @@ def reset_staff_password(staff_id: int):
             if formation_id and obj.formation_id != formation_id:
                 return jsonify({"detail": "Permission denied: Different Formation"}), 403
             
-            obj.password_hash = None # Reset to use NIS number
-            db.add(obj)
-            db.commit()
+            # Reset to use NIS number; single-column Core UPDATE, no reload.
+            crud.update_staff_fields(db, staff_id, {"password_hash": None})
             crud.create_audit_log(db, "RESET_PASSWORD", f"Staff: {obj.nis_no}", "Reset password to default", formation_id=obj.formation_id, office_id=None, user_id=user["id"], username=user["sub"])
             return jsonify({"detail": "Password reset successfully"})
     except Exception as e:
@@ -1997,7 +2025,6 @@ def update_staff_role(staff_id: int):
             obj.role = new_role
             db.add(obj)
             db.commit()
-            db.refresh(obj)
             crud.create_audit_log(db, "ROLE_UPDATE", f"Staff: {obj.nis_no}", f"Role set to {new_role}", formation_id=obj.formation_id, office_id=None, user_id=user["id"], username=user["sub"])
             return jsonify(schemas.to_dict_staff(obj))
     except Exception as e:
@@ -2167,18 +2194,19 @@ def move_staff(staff_id: int):
             # Notifications
             notif_msg = f"Staff {action_type.title()}: {staff.nis_no} ({staff.rank}) to {new_office}"
             
+            # All three broadcasts ride the final commit below (one fsync)
             # 1. Notify Target Office Admin
             if target_office_obj:
-                crud.broadcast_notification(db, notif_msg, office_id=target_office_obj.id)
-            
+                crud.broadcast_notification(db, notif_msg, office_id=target_office_obj.id, commit=False)
+
             # 2. Notify Main Admin
-            crud.broadcast_notification(db, notif_msg, role="main_admin")
-            
+            crud.broadcast_notification(db, notif_msg, role="main_admin", commit=False)
+
             # 3. Notify Formation Admin
             # If Posting, target formation. If Move, current formation.
             target_fmt_notif = target_fmt_id if action_type == "POSTING" else staff.formation_id
-            crud.broadcast_notification(db, notif_msg, formation_id=target_fmt_notif)
-            
+            crud.broadcast_notification(db, notif_msg, formation_id=target_fmt_notif, commit=False)
+
             db.commit()
             crud.create_audit_log(db, action_type, f"Staff: {staff.nis_no}", f"{action_type} from {old_office} to {new_office}", formation_id=staff.formation_id, office_id=target_office_obj.id, user_id=user["id"], username=user["sub"])
             return jsonify(schemas.to_dict_staff(staff))
@@ -2438,11 +2466,12 @@ def posting_staff(staff_id: int):
         # Notifications
         notif_msg = f"Staff Posted: {staff.nis_no} ({staff.rank}) to {new_fmt_name} - {new_office}"
 
+        # All broadcasts ride the final commit below (one fsync)
         # 1. Notify Target Formation Admin
-        crud.broadcast_notification(db, notif_msg, formation_id=new_formation_id)
+        crud.broadcast_notification(db, notif_msg, formation_id=new_formation_id, commit=False)
 
         # 2. Notify Main Admin
-        crud.broadcast_notification(db, notif_msg, role="main_admin")
+        crud.broadcast_notification(db, notif_msg, role="main_admin", commit=False)
 
         # 3. Notify Target Office Admin (if office is known and valid)
         if new_office:
@@ -2451,7 +2480,7 @@ def posting_staff(staff_id: int):
                 func.lower(models.Office.name) == new_office.lower()
             ).first()
             if target_off:
-                 crud.broadcast_notification(db, notif_msg, office_id=target_off.id)
+                 crud.broadcast_notification(db, notif_msg, office_id=target_off.id, commit=False)
 
         db.commit()
         crud.create_audit_log(db, "POSTING", f"Staff: {staff.nis_no}", f"Posted from {old_fmt_name} to {new_fmt_name}", formation_id=new_formation_id, office_id=None, user_id=user["id"], username=user["sub"])
@@ -2644,9 +2673,12 @@ def get_audit_logs():
 
     limit = request.args.get("limit", 100, type=int)
     offset = request.args.get("offset", 0, type=int)
-    
+
+    # Keyset cursor (last seen log id) — preferred over offset for deep pages
+    after = request.args.get("after", type=int)
+
     with next(get_db()) as db:
-        logs = crud.list_audit_logs(db, limit=limit, offset=offset, formation_id=formation_id, office_id=office_id, actions=actions)
+        logs = crud.list_audit_logs(db, limit=limit, offset=offset, formation_id=formation_id, office_id=office_id, actions=actions, after=after)
         return jsonify([schemas.to_dict_audit_log(l) for l in logs])
 
 @app.get("/export/excel")
@@ -155,6 +155,154 @@ def run_migrations():
                         conn.execute(text("ALTER TABLE staff ADD COLUMN custom_data TEXT"))
                 print("Column 'custom_data' added to 'staff' successfully.")
 
+        # 7. Pre-lowercased shadow columns for case-insensitive lookups
+        lower_columns = [
+            ("staff", "office_lower", "VARCHAR(64)", "office"),
+            ("offices", "name_lower", "VARCHAR(128)", "name"),
+        ]
+        for table, column, coltype, source in lower_columns:
+            if table in table_names:
+                columns = [c['name'] for c in inspector.get_columns(table)]
+                if column not in columns:
+                    print(f"Column '{column}' missing in '{table}'. Adding and backfilling...")
+                    with engine.connect() as conn:
+                        with conn.begin():
+                            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {coltype}"))
+                            conn.execute(text(f"UPDATE {table} SET {column} = LOWER({source}) WHERE {source} IS NOT NULL"))
+                    print(f"Column '{column}' added to '{table}' successfully.")
+
+        # 8. Lowercased search_blob column backing the free-text staff search
+        if 'staff' in table_names:
+            columns = [c['name'] for c in inspector.get_columns('staff')]
+            if 'search_blob' not in columns:
+                print("Column 'search_blob' missing in 'staff'. Adding and backfilling...")
+                with engine.connect() as conn:
+                    with conn.begin():
+                        conn.execute(text("ALTER TABLE staff ADD COLUMN search_blob TEXT"))
+                        conn.execute(text(
+                            "UPDATE staff SET search_blob = LOWER(TRIM("
+                            "COALESCE(surname,'') || ' ' || COALESCE(other_names,'') || ' ' || "
+                            "COALESCE(nis_no,'') || ' ' || COALESCE(phone_no,'') || ' ' || COALESCE(office,'')))"
+                        ))
+                print("Column 'search_blob' added to 'staff' successfully.")
+
+        # 9. Numeric rank_order column for index-friendly seniority sorting
+        if 'staff' in table_names:
+            columns = [c['name'] for c in inspector.get_columns('staff')]
+            if 'rank_order' not in columns:
+                print("Column 'rank_order' missing in 'staff'. Adding and backfilling...")
+                from app.models import RANK_WHENS
+                with engine.connect() as conn:
+                    with conn.begin():
+                        conn.execute(text("ALTER TABLE staff ADD COLUMN rank_order INTEGER"))
+                        for rank_name, order in RANK_WHENS.items():
+                            conn.execute(
+                                text("UPDATE staff SET rank_order = :o WHERE rank = :r"),
+                                {"o": order, "r": rank_name}
+                            )
+                        conn.execute(text("UPDATE staff SET rank_order = 999 WHERE rank_order IS NULL"))
+                print("Column 'rank_order' added to 'staff' successfully.")
+
+        # 10. Materialized completeness flag for the completed/incomplete filter
+        if 'staff' in table_names:
+            columns = [c['name'] for c in inspector.get_columns('staff')]
+            if 'is_complete' not in columns:
+                print("Column 'is_complete' missing in 'staff'. Adding and backfilling...")
+                from app.models import COMPLETENESS_TEXT_FIELDS, COMPLETENESS_VALUE_FIELDS
+                conds = []
+                for f in COMPLETENESS_TEXT_FIELDS:
+                    conds.append(f"{f} IS NOT NULL AND {f} <> ''")
+                for f in COMPLETENESS_VALUE_FIELDS:
+                    conds.append(f"{f} IS NOT NULL")
+                with engine.connect() as conn:
+                    with conn.begin():
+                        conn.execute(text("ALTER TABLE staff ADD COLUMN is_complete INTEGER NOT NULL DEFAULT 0"))
+                        conn.execute(text(
+                            "UPDATE staff SET is_complete = CASE WHEN "
+                            + " AND ".join(conds) + " THEN 1 ELSE 0 END"
+                        ))
+                print("Column 'is_complete' added to 'staff' successfully.")
+
+        # 11. Stored retirement date (MIN(dob+60y, dofa+35y), NULL for CGI)
+        if 'staff' in table_names:
+            columns = [c['name'] for c in inspector.get_columns('staff')]
+            if 'retirement_date' not in columns:
+                print("Column 'retirement_date' missing in 'staff'. Adding and backfilling...")
+                if engine.dialect.name == "postgresql":
+                    backfill = (
+                        "UPDATE staff SET retirement_date = CASE WHEN rank = 'CGI' THEN NULL "
+                        "ELSE LEAST(dob + INTERVAL '60 years', dofa + INTERVAL '35 years')::date END"
+                    )
+                else:
+                    # SQLite's scalar min() returns NULL if either side is
+                    # NULL, so the single-input cases are spelled out.
+                    backfill = (
+                        "UPDATE staff SET retirement_date = CASE "
+                        "WHEN rank = 'CGI' THEN NULL "
+                        "WHEN dob IS NOT NULL AND dofa IS NOT NULL THEN "
+                        "min(date(dob, '+60 years'), date(dofa, '+35 years')) "
+                        "WHEN dob IS NOT NULL THEN date(dob, '+60 years') "
+                        "WHEN dofa IS NOT NULL THEN date(dofa, '+35 years') "
+                        "ELSE NULL END"
+                    )
+                with engine.connect() as conn:
+                    with conn.begin():
+                        conn.execute(text("ALTER TABLE staff ADD COLUMN retirement_date DATE"))
+                        conn.execute(text(backfill))
+                print("Column 'retirement_date' added to 'staff' successfully.")
+
+        # 12. Composite indexes for list_staff and notification queries
+        index_ddl = [
+            "CREATE INDEX IF NOT EXISTS ix_staff_active_sort ON staff (exit_date, rank, dopa)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_formation_office ON staff (formation_id, office)",
+            "CREATE INDEX IF NOT EXISTS ix_notif_user_ts ON notifications (user_id, timestamp DESC)",
+            "CREATE INDEX IF NOT EXISTS ix_notif_staff_ts ON notifications (staff_id, timestamp DESC)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_office_lower ON staff (office_lower)",
+            "CREATE INDEX IF NOT EXISTS ix_offices_name_lower ON offices (name_lower)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_rank_order ON staff (rank_order)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_active_rank_dopa_nis ON staff (rank_order, dopa, nis_no)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_active_dopp_nis ON staff (dopp, nis_no)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_exit_date_nis ON staff (exit_date, nis_no)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_is_complete ON staff (is_complete)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_retirement_date ON staff (retirement_date)",
+            "CREATE INDEX IF NOT EXISTS ix_audit_timestamp_desc ON audit_logs (timestamp DESC)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_office_name_formation ON offices (name_lower, COALESCE(formation_id, 0))",
+            "CREATE INDEX IF NOT EXISTS ix_audit_formation_ts ON audit_logs (formation_id, timestamp DESC)",
+            "CREATE INDEX IF NOT EXISTS ix_audit_office_ts ON audit_logs (office_id, timestamp DESC)",
+            "CREATE INDEX IF NOT EXISTS ix_edit_status_created ON staff_edit_requests (status, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_formation_list ON staff (formation_id, exit_date, rank_order, dopa, nis_no)",
+            "CREATE INDEX IF NOT EXISTS ix_staff_formation_dopp ON staff (formation_id, exit_date, dopp, nis_no)",
+        ]
+        # On Postgres the active-staff indexes are partial: the serving-staff
+        # list only ever scans exit_date IS NULL rows.
+        if engine.dialect.name == "postgresql":
+            partial = ("ix_staff_active_rank_dopa_nis", "ix_staff_active_dopp_nis")
+            index_ddl = [
+                d + " WHERE exit_date IS NULL" if any(p in d for p in partial) else d
+                for d in index_ddl
+            ]
+        for ddl in index_ddl:
+            try:
+                with engine.connect() as conn:
+                    with conn.begin():
+                        conn.execute(text(ddl))
+            except Exception as e:
+                print(f"Failed to create index ({ddl}): {e}")
+
+        # 13. Trigram index so the %q% search on search_blob stops seq-scanning.
+        # Postgres-only: SQLite has no equivalent and stays on the LIKE scan.
+        if engine.dialect.name == "postgresql":
+            try:
+                with engine.connect() as conn:
+                    with conn.begin():
+                        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                        conn.execute(text(
+                            "CREATE INDEX IF NOT EXISTS ix_staff_search_blob_trgm "
+                            "ON staff USING gin (search_blob gin_trgm_ops)"
+                        ))
+            except Exception as e:
+                print(f"Failed to create trigram search index: {e}")
+
     except Exception as e:
         print(f"Migration failed: {e}")
         import traceback
@@ -1,8 +1,16 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, UniqueConstraint, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, UniqueConstraint, DateTime, Boolean, Text, Index, event, text, case, and_
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
 
+# Rank order mapping (Highest to Lowest). Lives here (not crud) so the
+# rank_order sync listener below can use it without a circular import.
+RANK_ORDER = [
+    "CGI", "DCG", "ACG", "CIS", "DCI", "ACI", "CSI", "SI", "DSI",
+    "ASI 1", "ASI 2", "II", "AII", "IA 1", "IA 2", "IA 3"
+]
+RANK_WHENS = {name: i for i, name in enumerate(RANK_ORDER)}
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -10,9 +18,14 @@ class AuditLog(Base):
     target = Column(String(256), nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     details = Column(String(512), nullable=True)
-    formation_id = Column(Integer, ForeignKey("formations.id"), nullable=True)
-    office_id = Column(Integer, ForeignKey("offices.id"), nullable=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # Historical references, deliberately not ForeignKeys: audit rows must
+    # outlive the entities they mention (and survive deleting them), and
+    # user_id records the acting identity, which can come from either the
+    # users or the staff table depending on role. Matches the migrated
+    # production schema, where these columns were added as plain integers.
+    formation_id = Column(Integer, nullable=True)
+    office_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=True)
     username = Column(String(64), nullable=True)
 
 class Formation(Base):
@@ -52,21 +65,6 @@ class User(Base):
     formation_id = Column(Integer, ForeignKey("formations.id"), nullable=True)
     formation = relationship("Formation", back_populates="users")
 
-class Notification(Base):
-    __tablename__ = "notifications"
-    __table_args__ = {'extend_existing': True}
-    id = Column(Integer, primary_key=True, index=True)
-    message = Column(String(512), nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    is_read = Column(Boolean, default=False)
-    
-    # Target can be a User (Special/Formation Admin) or Staff (Office/Main Admin)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    staff_id = Column(Integer, ForeignKey("staff.id"), nullable=True)
-    
-    user = relationship("User")
-    staff = relationship("Staff")
-
 class Office(Base):
     __tablename__ = "offices"
     id = Column(Integer, primary_key=True, index=True)
@@ -74,6 +72,11 @@ class Office(Base):
     formation_id = Column(Integer, ForeignKey("formations.id"), nullable=True)
     formation = relationship("Formation", back_populates="offices")
     
+    # Pre-lowercased copy of name so case-insensitive lookups can use a plain
+    # BTREE index instead of lower(name) forcing a scan. Kept in sync by the
+    # attribute listener at the bottom of this module.
+    name_lower = Column(String(128), nullable=True, index=True)
+
     office_type = Column(String(32), nullable=True)
     parent_id = Column(Integer, ForeignKey("offices.id"), nullable=True)
     parent = relationship("Office", remote_side=[id], backref="children")
@@ -88,6 +91,10 @@ class Staff(Base):
     surname = Column(String(128), nullable=False, index=True)
     other_names = Column(String(128), nullable=False)
     rank = Column(String(64), nullable=False, index=True)
+    # Numeric position of rank in the seniority order (0 = CGI ... 999 =
+    # unknown), maintained by the listener below so ORDER BY can use a plain
+    # index instead of evaluating a 16-branch CASE per row.
+    rank_order = Column(Integer, nullable=True, index=True)
     gender = Column(String(16), nullable=True, index=True)
     dofa = Column(Date, nullable=True)
     dopa = Column(Date, nullable=True)
@@ -101,6 +108,9 @@ class Staff(Base):
     next_of_kin = Column(String(128), nullable=True)
     nok_phone = Column(String(32), nullable=True)
     office = Column(String(64), nullable=True, index=True)
+    # Pre-lowercased office name (see Office.name_lower); indexed for the
+    # office-admin lookups in broadcast_notification / process_due_retirements.
+    office_lower = Column(String(64), nullable=True, index=True)
     email = Column(String(128), nullable=True, index=True)
     remark = Column(String(256), nullable=True)
     exit_date = Column(Date, nullable=True)
@@ -111,6 +121,16 @@ class Staff(Base):
     out_request_date = Column(Date, nullable=True)
     out_request_reason = Column(String(64), nullable=True)
 
+    # Lowercased "surname other_names nis_no phone_no office" blob so the
+    # free-text search probes one column instead of OR-ing ilike over five.
+    # Maintained by the flush listeners at the bottom of this module.
+    search_blob = Column(Text, nullable=True)
+
+    # 1 when every critical field is filled (see COMPLETENESS_* below).
+    # Maintained by the flush listeners so the completeness filter is a
+    # single indexed equality instead of a 20-term WHERE over the table.
+    is_complete = Column(Integer, default=0, nullable=False)
+
     password_hash = Column(String(128), nullable=True) # For custom passwords
     role = Column(String(32), nullable=False, default="staff") # staff, office_admin, main_admin
     login_count = Column(Integer, default=0, nullable=False)
@@ -126,30 +146,12 @@ class Staff(Base):
     formation_dopp = Column(Date, nullable=True)
     custom_data = Column(Text, nullable=True) # JSON string for custom fields
 
-    @property
-    def retirement_date(self):
-        if self.rank == 'CGI':
-            return None # Exempt
-            
-        dates = []
-        if self.dob:
-            # 60 years from DOB
-            try:
-                dates.append(self.dob.replace(year=self.dob.year + 60))
-            except ValueError: # Feb 29
-                dates.append(self.dob.replace(year=self.dob.year + 60, day=28))
-                
-        if self.dofa:
-            # 35 years from DOFA
-            try:
-                dates.append(self.dofa.replace(year=self.dofa.year + 35))
-            except ValueError:
-                dates.append(self.dofa.replace(year=self.dofa.year + 35, day=28))
-        
-        if not dates:
-            return None
-            
-        return min(dates)
+    # Statutory retirement date — MIN(dob + 60y, dofa + 35y), NULL for the
+    # exempt CGI rank or when both inputs are missing. Stored (was a Python
+    # property) so the retirement filter/sort can range-scan an index instead
+    # of recomputing date arithmetic per row; maintained by the flush
+    # listeners at the bottom of this module.
+    retirement_date = Column(Date, nullable=True)
 
 class CustomFieldDefinition(Base):
     __tablename__ = "custom_field_definitions"
@@ -201,7 +203,6 @@ class StaffEditRequest(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
-    __table_args__ = {'extend_existing': True}
     id = Column(Integer, primary_key=True, index=True)
     message = Column(String(512), nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
@@ -216,6 +217,158 @@ class Notification(Base):
     office_name = Column(String(128), nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now()) # Alias for timestamp if code uses it
-    
+
     user = relationship("User")
     staff = relationship("Staff")
+
+
+# Composite indexes backing the hot list queries.
+# list_staff filters on exit_date and sorts by rank/dopa; it also filters by
+# formation + office. get_user_notifications filters by user_id/staff_id and
+# sorts newest-first. These are created idempotently in migrations.run_migrations.
+Index("ix_staff_active_sort", Staff.exit_date, Staff.rank, Staff.dopa)
+Index("ix_staff_formation_office", Staff.formation_id, Staff.office)
+Index("ix_notif_user_ts", Notification.user_id, Notification.timestamp.desc())
+Index("ix_notif_staff_ts", Notification.staff_id, Notification.timestamp.desc())
+
+# Indexes that exactly match list_staff's ORDER BY shapes, so pagination is
+# an index range scan with no sort step. The dominant predicate is
+# "exit_date IS NULL" (serving staff), so on Postgres those are partial;
+# SQLite ignores postgresql_where and builds them as plain composites,
+# which still satisfies the sort.
+Index("ix_staff_active_rank_dopa_nis", Staff.rank_order, Staff.dopa, Staff.nis_no,
+      postgresql_where=text("exit_date IS NULL"))
+Index("ix_staff_active_dopp_nis", Staff.dopp, Staff.nis_no,
+      postgresql_where=text("exit_date IS NULL"))
+Index("ix_staff_exit_date_nis", Staff.exit_date, Staff.nis_no)
+Index("ix_staff_is_complete", Staff.is_complete)
+Index("ix_staff_retirement_date", Staff.retirement_date)
+# Formation-scoped listings (formation admins) filter on formation_id +
+# exit_date before the usual sort; lead with those so the whole predicate
+# and sort ride one index.
+Index("ix_staff_formation_list", Staff.formation_id, Staff.exit_date, Staff.rank_order, Staff.dopa, Staff.nis_no)
+Index("ix_staff_formation_dopp", Staff.formation_id, Staff.exit_date, Staff.dopp, Staff.nis_no)
+Index("ix_audit_timestamp_desc", AuditLog.timestamp.desc())
+Index("ix_audit_formation_ts", AuditLog.formation_id, AuditLog.timestamp.desc())
+Index("ix_audit_office_ts", AuditLog.office_id, AuditLog.timestamp.desc())
+# Pending edit requests are a thin slice of the table; leading with status
+# keeps the review queue an index range scan ordered by created_at.
+Index("ix_edit_status_created", StaffEditRequest.status, StaffEditRequest.created_at)
+
+# Office names are unique per formation, case-insensitively. formation_id is
+# coalesced so two formation-less offices can't share a name either (NULLs
+# never collide in a plain unique index).
+Index("uq_office_name_formation", Office.name_lower, func.coalesce(Office.formation_id, 0), unique=True)
+
+
+# Keep the *_lower shadow columns in sync no matter where the assignment
+# happens (crud helpers or direct attribute writes in main.py). Core-level
+# bulk UPDATEs bypass these listeners and must set both columns themselves.
+@event.listens_for(Staff.office, "set", retval=True)
+def _sync_staff_office_lower(target, value, oldvalue, initiator):
+    target.office_lower = value.lower() if value else value
+    return value
+
+@event.listens_for(Office.name, "set", retval=True)
+def _sync_office_name_lower(target, value, oldvalue, initiator):
+    target.name_lower = value.lower() if value else value
+    return value
+
+@event.listens_for(Staff.rank, "set", retval=True)
+def _sync_staff_rank_order(target, value, oldvalue, initiator):
+    target.rank_order = RANK_WHENS.get(value, 999)
+    return value
+
+SEARCH_BLOB_FIELDS = ("surname", "other_names", "nis_no", "phone_no", "office")
+
+def staff_search_blob_expr(**overrides):
+    """
+    SQL expression matching the Python-side blob, for Core bulk UPDATEs.
+    Pass the new value as a keyword (e.g. office="New Name") for any field
+    the same UPDATE is changing — SET expressions see pre-update values.
+    """
+    parts = [
+        overrides[f] if f in overrides else func.coalesce(getattr(Staff, f), "")
+        for f in SEARCH_BLOB_FIELDS
+    ]
+    joined = parts[0]
+    for p in parts[1:]:
+        joined = joined + " " + p
+    return func.lower(func.trim(joined))
+
+@event.listens_for(Staff, "before_insert")
+@event.listens_for(Staff, "before_update")
+def _sync_staff_search_blob(mapper, connection, target):
+    values = [getattr(target, f, None) for f in SEARCH_BLOB_FIELDS]
+    target.search_blob = " ".join(v.lower() for v in values if v)
+
+# The critical fields behind the "completed"/"incomplete" staff filter.
+# Text fields must also be non-empty; value fields just non-NULL.
+COMPLETENESS_TEXT_FIELDS = ("surname", "other_names", "rank", "gender", "phone_no", "office")
+COMPLETENESS_VALUE_FIELDS = ("dob", "state_id", "lga_id", "dofa", "dopa", "dopp")
+COMPLETENESS_FIELDS = COMPLETENESS_TEXT_FIELDS + COMPLETENESS_VALUE_FIELDS
+
+def staff_is_complete(values):
+    """Python-side completeness check over a field-name -> value mapping."""
+    for f in COMPLETENESS_TEXT_FIELDS:
+        if not values.get(f):
+            return 0
+    for f in COMPLETENESS_VALUE_FIELDS:
+        if values.get(f) is None:
+            return 0
+    return 1
+
+def staff_is_complete_expr(**overrides):
+    """
+    SQL expression matching staff_is_complete, for Core bulk UPDATEs.
+    As with staff_search_blob_expr, pass the new value as a keyword for any
+    field the same UPDATE is changing.
+    """
+    conds = []
+    for f in COMPLETENESS_TEXT_FIELDS:
+        if f in overrides:
+            if not overrides[f]:
+                return 0
+        else:
+            col = getattr(Staff, f)
+            conds.extend((col.is_not(None), col != ""))
+    for f in COMPLETENESS_VALUE_FIELDS:
+        if f in overrides:
+            if overrides[f] is None:
+                return 0
+        else:
+            conds.append(getattr(Staff, f).is_not(None))
+    if not conds:
+        return 1
+    return case((and_(*conds), 1), else_=0)
+
+@event.listens_for(Staff, "before_insert")
+@event.listens_for(Staff, "before_update")
+def _sync_staff_is_complete(mapper, connection, target):
+    target.is_complete = staff_is_complete(
+        {f: getattr(target, f, None) for f in COMPLETENESS_FIELDS}
+    )
+
+def staff_retirement_date(rank, dob, dofa):
+    """MIN(dob + 60y, dofa + 35y); None for CGI (exempt) or no inputs."""
+    if rank == 'CGI':
+        return None
+    dates = []
+    if dob:
+        try:
+            dates.append(dob.replace(year=dob.year + 60))
+        except ValueError:  # Feb 29
+            dates.append(dob.replace(year=dob.year + 60, day=28))
+    if dofa:
+        try:
+            dates.append(dofa.replace(year=dofa.year + 35))
+        except ValueError:
+            dates.append(dofa.replace(year=dofa.year + 35, day=28))
+    if not dates:
+        return None
+    return min(dates)
+
+@event.listens_for(Staff, "before_insert")
+@event.listens_for(Staff, "before_update")
+def _sync_staff_retirement_date(mapper, connection, target):
+    target.retirement_date = staff_retirement_date(target.rank, target.dob, target.dofa)